@@ -5,6 +5,7 @@ from matplotlib import pyplot
 from glyfish import config
 
 def metropolis_hastings_target_pdf(μ1, μ2, σ1, σ2, γ):
+    c = 2 * numpy.pi * σ1 * σ2 * numpy.sqrt(1.0 - γ**2)
     def f(x, i, x_current):
         if i == 0:
             y1 = (x - μ1) / σ1
@@ -12,11 +13,23 @@ def metropolis_hastings_target_pdf(μ1, μ2, σ1, σ2, γ):
         else:
             y1 = (x_current[0] - μ1) / σ1
             y2 = (x - μ2) / σ2
-        c = 2 * numpy.pi * σ1 * σ2 * numpy.sqrt(1.0 - γ**2)
         ε = (y1**2 + y2**2 - 2.0 * γ * y1 * y2) / (2.0 * (1.0 - γ**2))
         return numpy.exp(-ε) / c
     return f
 
+def metropolis_hastings_target_log_pdf(μ1, μ2, σ1, σ2, γ):
+    log_c = numpy.log(2 * numpy.pi * σ1 * σ2 * numpy.sqrt(1.0 - γ**2))
+    def f(x, i, x_current):
+        if i == 0:
+            y1 = (x - μ1) / σ1
+            y2 = (x_current[1] - μ2) / σ2
+        else:
+            y1 = (x_current[0] - μ1) / σ1
+            y2 = (x - μ2) / σ2
+        ε = (y1**2 + y2**2 - 2.0 * γ * y1 * y2) / (2.0 * (1.0 - γ**2))
+        return -ε - log_c
+    return f
+
 def marginal(μ, σ):
     def f(x):
         y = (x - μ) / σ
@@ -24,14 +37,24 @@ def marginal(μ, σ):
     return f
 
 def pdf(μ1, μ2, σ1, σ2, γ):
+    c = 2 * numpy.pi * σ1 * σ2 * numpy.sqrt(1.0 - γ**2)
     def f(x):
         y1 = (x[0] - μ1) / σ1
         y2 = (x[1] - μ2) / σ2
-        c = 2 * numpy.pi * σ1 * σ2 * numpy.sqrt(1.0 - γ**2)
         ε = (y1**2 + y2**2 - 2.0 * γ * y1 * y2) / (2.0 * (1.0 - γ**2))
         return numpy.exp(-ε) / c
     return f
 
+# joint log density of x with shape (..., 2), evaluated for a batch of points in one call
+def log_pdf(μ1, μ2, σ1, σ2, γ):
+    log_c = numpy.log(2 * numpy.pi * σ1 * σ2 * numpy.sqrt(1.0 - γ**2))
+    scale = 2.0 * (1.0 - γ**2)
+    def f(x):
+        y1 = (x[..., 0] - μ1) / σ1
+        y2 = (x[..., 1] - μ2) / σ2
+        return -(y1**2 + y2**2 - 2.0 * γ * y1 * y2) / scale - log_c
+    return f
+
 def conditional_pdf_y1_y2(μ1, μ2, σ1, σ2, γ):
     def f(x1, x2):
         y1 = (x1 - μ1)
@@ -0,0 +1,57 @@
+import os
+import numpy
+from glyfish.random_blocks import RandomBlocks
+
+# State of a sampler chain: the current position, its cached log density (-U for HMC),
+# the RandomBlocks random number stream, the number of iterations run and the number accepted.
+# A chain saved to .npz with save and loaded with load_chain_state continues with exactly the random
+# numbers it would have used if it had not been interrupted.
+class ChainState:
+    def __init__(self, position, log_density, blocks, iteration=0, accepted=0):
+        self.position = position
+        self.log_density = log_density
+        self.blocks = blocks
+        self.iteration = iteration
+        self.accepted = accepted
+
+    # the state is written to a temporary file that replaces path when it is complete, so an interrupted
+    # save leaves the previous state in place
+    def save(self, path):
+        path = state_path(path)
+        tmp_path = f"{path}.{os.getpid()}"
+        with open(tmp_path, "wb") as file:
+            numpy.savez(file, position=self.position, log_density=self.log_density, iteration=self.iteration,
+                        accepted=self.accepted, **self.blocks.get_state())
+        os.replace(tmp_path, path)
+
+def load_chain_state(path):
+    data = numpy.load(state_path(path))
+    blocks = RandomBlocks()
+    blocks.set_state(data)
+    position = data["position"]
+    if position.ndim == 0:
+        position = float(position)
+    return ChainState(position, float(data["log_density"]), blocks, int(data["iteration"]), int(data["accepted"]))
+
+# state files have the .npz suffix that numpy.savez adds to a path without it
+def state_path(path):
+    path = os.fspath(path)
+    return path if path.endswith(".npz") else path + ".npz"
+
+# Samples are stored as raw float64 in a file that chunks are appended to without reading or
+# rewriting existing samples. load_samples memory maps the file.
+
+def append_samples(path, samples):
+    with open(path, "ab") as file:
+        numpy.asarray(samples, dtype=numpy.float64).tofile(file)
+
+# discard samples beyond the first nvalues values, written after the last saved state of an interrupted run
+def truncate_samples(path, nvalues):
+    if os.path.exists(path) and os.path.getsize(path) > 8*nvalues:
+        os.truncate(path, 8*nvalues)
+
+def load_samples(path, ndim=None):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return numpy.zeros(0) if ndim is None else numpy.zeros((0, ndim))
+    samples = numpy.memmap(path, dtype=numpy.float64, mode="r")
+    return samples if ndim is None else samples.reshape(-1, ndim)
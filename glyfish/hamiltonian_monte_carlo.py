@@ -1,7 +1,11 @@
+import functools
+import itertools
 import numpy
+from scipy import linalg
 from matplotlib import pyplot
 from glyfish import config
 from glyfish import stats
+from glyfish import chain_state
 
 # Plots
 
@@ -23,9 +27,134 @@ def momentum_verlet_integrator(p0, q0, dUdq, dKdp, nsteps, ε):
 
     return p, q
 
-# Hamiltonian Monte Carlo
+# Momentum Verlet integration with whole vector gradients dUdq(q) and dKdp(p). It is
+# momentum_verlet_energy_integrator started from the gradient at q0 without the terminal potential.
+def momentum_verlet_vector_integrator(p0, q0, dUdq, dKdp, nsteps, ε):
+    q = numpy.array(q0, dtype=float)
+    p, q, _, _ = momentum_verlet_energy_integrator(p0, q, dUdq(q), None, dUdq, dKdp, nsteps, ε)
+    return p, q
+
+# stepsizes of the steps of a trajectory. For an array nsteps the stepsize of each chain at each of the
+# max(nsteps) steps, ε while the chain is running and zero after, with shape (max(nsteps), nchain, 1).
+def integrator_stepsizes(nsteps, ε):
+    if numpy.ndim(nsteps) == 0:
+        return itertools.repeat(ε, nsteps)
+    return ε*(numpy.arange(numpy.max(nsteps, initial=0))[:, numpy.newaxis] < nsteps)[:, :, numpy.newaxis]
+
+# Momentum Verlet integration for HMC_vector and HMC_chains. The trajectory starts from the known gradient ΔU0
+# at q0 and the terminal potential and gradient are returned so the sampler does not evaluate them again, the
+# gradient at the end of each step is the one used at the start of the next so each step costs one evaluation
+# of dUdq. The potential is not evaluated if U is None. For HMC_chains p0, q0 and ΔU0 are (nchain, ndim) arrays
+# and nsteps is an array with the trajectory length of each chain. All chains are stepped together for
+# max(nsteps) steps and a chain that has finished is masked with a zero stepsize so that it stays put.
+def momentum_verlet_energy_integrator(p0, q0, ΔU0, U, dUdq, dKdp, nsteps, ε):
+    p = numpy.array(p0, dtype=float)
+    q = numpy.array(q0, dtype=float)
+    ΔU = ΔU0
+
+    for εi in integrator_stepsizes(nsteps, ε):
+        p -= εi*ΔU/2.0
+        q += εi*dKdp(p)
+        ΔU = dUdq(q)
+        p -= εi*ΔU/2.0
+
+    return p, q, None if U is None else U(q), ΔU
+
+momentum_verlet_energy_integrator.ngradient = 1
+
+# the name used with HMC_chains
+momentum_verlet_chains_integrator = momentum_verlet_energy_integrator
+
+# Symmetric splitting integrators with whole vector gradients and the interface of momentum_verlet_energy_integrator.
+# A step of size ε kicks p by b[0]ε, then for each k drifts q by a[k]ε and kicks p by b[k+1]ε, using one
+# evaluation of dUdq per drift. The number of gradient evaluations per step is set as the ngradient
+# attribute. If nsteps is an array the chains of (nchain, ndim) arrays are masked by integrator_stepsizes
+# so the integrators may also be used with HMC_chains.
+def splitting_integrator(a, b):
+    def f(p0, q0, ΔU0, U, dUdq, dKdp, nsteps, ε):
+        p = numpy.array(p0, dtype=float)
+        q = numpy.array(q0, dtype=float)
+        ΔU = ΔU0
+
+        for εi in integrator_stepsizes(nsteps, ε):
+            p -= b[0]*εi*ΔU
+            for ak, bk in zip(a, b[1:]):
+                q += ak*εi*dKdp(p)
+                ΔU = dUdq(q)
+                p -= bk*εi*ΔU
+
+        return p, q, U(q), ΔU
+    f.ngradient = len(a)
+    return f
+
+# fourth order integrator of Yoshida, three leapfrog steps of sizes w1ε, w0ε, w1ε
+def yoshida4_integrator():
+    w1 = 1.0/(2.0 - 2.0**(1.0/3.0))
+    w0 = 1.0 - 2.0*w1
+    return splitting_integrator([w1, w0, w1], [w1/2.0, (w0 + w1)/2.0, (w0 + w1)/2.0, w1/2.0])
+
+# two stage second order integrator of Omelyan et. al. with λ minimizing the leading error term. It costs two
+# gradients per step but its error is small enough that a step of 2ε is accurate with the cost of two leapfrog steps of ε.
+def minimum_error_integrator(λ=0.19318332750378361):
+    return splitting_integrator([0.5, 0.5], [λ, 1.0 - 2.0*λ, λ])
+
+# integrators by name, hmc.integrators["yoshida4"] may be passed as the integrator of HMC_vector,
+# HMC_chains and adaptive_HMC. leapfrog is momentum_verlet_energy_integrator.
+integrators = {"leapfrog": momentum_verlet_energy_integrator,
+               "yoshida4": yoshida4_integrator(),
+               "minimum_error": minimum_error_integrator()}
+
+def register_integrator(name, integrator):
+    integrators[name] = integrator
+
+# Exact Hamiltonian flow for the Gaussian potential U(q) = (q - μ)ᵀP(q - μ)/2 with precision P and the
+# kinetic energy pᵀ(Minv p)/2, Minv the inverse mass matrix or its diagonal, the identity if None.
+# Hamilton's equations are linear in z = (q - μ, p) with dz/dt = Az, so a trajectory of time t = nsteps*ε is
+# the matrix product with the propagator exp(At), which is computed once for each t and cached. The flow
+# conserves H exactly so proposals are accepted with probability 1 up to round-off. It has the interface of
+# the splitting integrators, including an array nsteps for HMC_chains, and evaluates no gradients.
+def gaussian_exact_integrator(P, μ=0.0, Minv=None):
+    P = numpy.atleast_2d(P)
+    ndim = len(P)
+    if Minv is None:
+        Minv = numpy.eye(ndim)
+    elif numpy.ndim(Minv) == 1:
+        Minv = numpy.diag(Minv)
+    zero = numpy.zeros((ndim, ndim))
+    A = numpy.block([[zero, Minv], [-P, zero]])
+
+    @functools.lru_cache(maxsize=1024)
+    def propagator(t):
+        return linalg.expm(A*t).T
+
+    def f(p0, q0, ΔU0, U, dUdq, dKdp, nsteps, ε):
+        z = numpy.concatenate([numpy.asarray(q0, dtype=float) - μ, numpy.asarray(p0, dtype=float)], axis=-1)
+        if numpy.ndim(nsteps) == 0:
+            z = z @ propagator(nsteps*ε)
+        else:
+            for n in numpy.unique(nsteps):
+                chains = nsteps == n
+                z[chains] = z[chains] @ propagator(n*ε)
+        q = z[..., :ndim] + μ
+        p = z[..., ndim:]
+        return p, q, U(q), (q - μ) @ P
+    f.ngradient = 0
+    return f
+
+# Hamiltonian Monte Carlo. If blocks is a RandomBlocks instance the trajectory length and acceptance
+# uniforms are taken from it, otherwise from numpy.random. The first burn_in steps are discarded and
+# then every thin'th step is stored, giving (nsample - burn_in)//thin samples. accepted counts all steps.
+
+def HMC(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε, blocks=None, burn_in=0, thin=1):
+    H, pall, qall, accepted, _ = _HMC(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε, blocks, burn_in, thin)
+    return H, pall, qall, accepted
 
-def HMC(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε):
+# HMC kernel for HMC_stream and HMC_resume. If U0, the value of U(q0), is given it is not evaluated again
+# and the potential energy of the final state is returned with the samples so that a continued chain
+# can start from it.
+
+def _HMC(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε, blocks=None, burn_in=0, thin=1, U0=None):
+    uniform = numpy.random.rand if blocks is None else blocks.uniform
     ndim = len(q0)
     current_q = numpy.zeros(ndim)
     current_p = numpy.zeros(ndim)
@@ -33,10 +162,12 @@ def HMC(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε)
     for j in range(ndim):
         current_q[j] = q0[j]
 
-    H = numpy.zeros(nsample)
-    qall = numpy.zeros((nsample, ndim))
-    pall = numpy.zeros((nsample, ndim))
+    nretained = (nsample - burn_in)//thin
+    H = numpy.zeros(nretained)
+    qall = numpy.zeros((nretained, ndim))
+    pall = numpy.zeros((nretained, ndim))
     accepted = 0
+    current_U = U(current_q) if U0 is None else U0
 
     for i in range(nsample):
 
@@ -46,33 +177,401 @@ def HMC(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε)
 
         # integrate hamiltons equations using current_p and current_q to obtain proposal samples p and q
         # and negate p for detailed balance
-        nsteps = int(numpy.random.rand()*tmax/ε)
+        nsteps = int(uniform()*tmax/ε)
         p, q = integrator(current_p, current_q, dUdq, dKdp, nsteps, ε)
         p = -p
 
-        # compute acceptance probability
-        current_U = U(current_q)
+        # compute acceptance probability, current_U is carried over from the previous iteration
         current_K = K(current_p)
         proposed_U = U(q)
         proposed_K = K(p)
         α = numpy.exp(current_U-proposed_U+current_K-proposed_K)
 
         # accept or reject proposal
-        accept = numpy.random.rand()
+        accept = uniform()
 
         if accept < α:
             current_q = q
-            qall[i] = q
-            pall[i] = p
+            current_U = proposed_U
+            sample_p = p
             accepted += 1
         else:
-            qall[i] = current_q
-            pall[i] = current_p
+            sample_p = current_p
+
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            k = (i - burn_in)//thin
+            qall[k] = current_q
+            pall[k] = sample_p
+            H[k] = current_U + current_K
+
+    return H, pall, qall, accepted, current_U
+
+# Hamiltonian Monte Carlo with whole vector gradients dUdq(q) and dKdp(p) and a momentum_generator()
+# that returns the whole momentum vector. integrator(p0, q0, ΔU0, U, dUdq, dKdp, nsteps, ε) starts
+# from the gradient ΔU0 at q0 and returns the terminal p, q, potential and gradient. The potential
+# and gradient of the current state are carried across iterations, so each iteration evaluates U
+# once and dUdq once per integration step.
+def HMC_vector(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε, blocks=None, burn_in=0, thin=1):
+    uniform = numpy.random.rand if blocks is None else blocks.uniform
+    current_q = numpy.array(q0, dtype=float)
+    current_U = U(current_q)
+    current_ΔU = dUdq(current_q)
+    ndim = len(current_q)
+
+    nretained = (nsample - burn_in)//thin
+    H = numpy.zeros(nretained)
+    qall = numpy.zeros((nretained, ndim))
+    pall = numpy.zeros((nretained, ndim))
+    accepted = 0
+
+    for i in range(nsample):
+        current_p = momentum_generator()
 
-        H[i] = U(current_q) + K(current_p)
+        # integrate hamiltons equations and negate p for detailed balance
+        nsteps = int(uniform()*tmax/ε)
+        p, q, proposed_U, proposed_ΔU = integrator(current_p, current_q, current_ΔU, U, dUdq, dKdp, nsteps, ε)
+        p = -p
+
+        current_K = K(current_p)
+        α = numpy.exp(current_U - proposed_U + current_K - K(p))
+
+        if uniform() < α:
+            current_q = q
+            current_U = proposed_U
+            current_ΔU = proposed_ΔU
+            sample_p = p
+            accepted += 1
+        else:
+            sample_p = current_p
+
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            k = (i - burn_in)//thin
+            qall[k] = current_q
+            pall[k] = sample_p
+            H[k] = current_U + current_K
+
+    return H, pall, qall, accepted
+
+# Hamiltonian Monte Carlo advancing nchain chains in lock step. q0 is an (nchain, ndim) array of starting
+# points, U(q) and K(p) map (nchain, ndim) arrays to nchain energies, dUdq(q) and dKdp(p) return
+# (nchain, ndim) gradients and momentum_generator(nchain) returns an (nchain, ndim) momentum sample.
+# Each chain draws its own trajectory length which integrator(p0, q0, ΔU0, U, dUdq, dKdp, nsteps, ε) handles
+# by masking, see momentum_verlet_energy_integrator. Returns H with shape (nchain, nretained), p and q
+# with shape (nchain, nretained, ndim) and the accepted count of each chain.
+def HMC_chains(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε, blocks=None, burn_in=0, thin=1):
+    uniform = numpy.random.rand if blocks is None else blocks.generator.random
+    current_q = numpy.array(q0, dtype=float)
+    current_U = U(current_q)
+    current_ΔU = dUdq(current_q)
+    nchain, ndim = current_q.shape
+
+    nretained = (nsample - burn_in)//thin
+    H = numpy.zeros((nchain, nretained))
+    qall = numpy.zeros((nchain, nretained, ndim))
+    pall = numpy.zeros((nchain, nretained, ndim))
+    accepted = numpy.zeros(nchain, dtype=int)
+
+    for i in range(nsample):
+        current_p = momentum_generator(nchain)
+
+        # integrate hamiltons equations and negate p for detailed balance
+        nsteps = (uniform(nchain)*tmax/ε).astype(int)
+        p, q, proposed_U, proposed_ΔU = integrator(current_p, current_q, current_ΔU, U, dUdq, dKdp, nsteps, ε)
+        p = -p
+
+        current_K = K(current_p)
+        α = numpy.exp(current_U - proposed_U + current_K - K(p))
+
+        accepted_step = uniform(nchain) < α
+        accepted += accepted_step
+        current_q = numpy.where(accepted_step[:, numpy.newaxis], q, current_q)
+        current_U = numpy.where(accepted_step, proposed_U, current_U)
+        current_ΔU = numpy.where(accepted_step[:, numpy.newaxis], proposed_ΔU, current_ΔU)
+
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            k = (i - burn_in)//thin
+            qall[:, k] = current_q
+            pall[:, k] = numpy.where(accepted_step[:, numpy.newaxis], p, current_p)
+            H[:, k] = current_U + current_K
 
     return H, pall, qall, accepted
 
+# Adaptive Hamiltonian Monte Carlo. During nwarmup iterations of HMC_vector log(ε) is tuned by the
+# dual averaging algorithm of Hoffman and Gelman toward target_acceptance, the mean of min(1, α). ε is then
+# frozen at the averaged value and nsample samples are generated by HMC_vector. The adapted ε is returned
+# with the samples.
+def adaptive_HMC(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nwarmup, nsample, tmax, ε, target_acceptance=0.65, blocks=None, burn_in=0, thin=1):
+    q, ε, _ = dual_averaging_stepsize(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nwarmup, tmax, ε, target_acceptance, blocks)
+    H, pall, qall, accepted = HMC_vector(q, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε, blocks, burn_in, thin)
+    return H, pall, qall, accepted, ε
+
+# dual averaging with shrinkage point μ = log(10ε), where ε is the initial stepsize, and the
+# recommended γ=0.05, t0=10 and κ=0.75. Returns the last position, the adapted ε and the warmup samples.
+def dual_averaging_stepsize(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nwarmup, tmax, ε, target_acceptance=0.65, blocks=None, γ=0.05, t0=10.0, κ=0.75):
+    uniform = numpy.random.rand if blocks is None else blocks.uniform
+    current_q = numpy.array(q0, dtype=float)
+    current_U = U(current_q)
+    current_ΔU = dUdq(current_q)
+    μ = numpy.log(10.0*ε)
+    log_ε = numpy.log(ε)
+    log_ε_bar = 0.0
+    H_bar = 0.0
+    qall = numpy.zeros((nwarmup, len(current_q)))
+
+    for i in range(nwarmup):
+        # at least one step is taken since an empty trajectory is always accepted
+        current_p = momentum_generator()
+        nsteps = max(1, int(uniform()*tmax/ε))
+        p, q, proposed_U, proposed_ΔU = integrator(current_p, current_q, current_ΔU, U, dUdq, dKdp, nsteps, ε)
+        α = min(1.0, numpy.exp(current_U - proposed_U + K(current_p) - K(-p)))
+        if not α >= 0.0:
+            α = 0.0
+        if uniform() < α:
+            current_q = q
+            current_U = proposed_U
+            current_ΔU = proposed_ΔU
+        qall[i] = current_q
+
+        t = i + 1
+        H_bar += (target_acceptance - α - H_bar)/(t + t0)
+        log_ε = μ - numpy.sqrt(t)*H_bar/γ
+        log_ε_bar += t**(-κ)*(log_ε - log_ε_bar)
+        ε = numpy.exp(log_ε)
+
+    return current_q, numpy.exp(log_ε_bar) if nwarmup > 0 else ε, qall
+
+# Hamiltonian Monte Carlo with an adapted mass matrix. The kinetic energy is p·(Minv p)/2 where Minv,
+# the inverse mass matrix, is estimated from the warmup samples as the covariance of the target,
+# the diagonal of it if dense is False. Warmup follows the windowed scheme of Stan: ε alone is adapted
+# by dual averaging in an initial buffer, then Minv is estimated from the samples of a series of
+# doubling windows, with ε adaptation restarted at the end of each, and ε is finally adapted with
+# the last Minv in a terminal buffer. Returns the samples of HMC_vector, ε and Minv.
+def adaptive_mass_HMC(q0, U, dUdq, integrator, nwarmup, nsample, tmax, ε, dense=False, target_acceptance=0.65, blocks=None, burn_in=0, thin=1):
+    q, ε, Minv = adapt_mass_matrix(q0, U, dUdq, integrator, nwarmup, tmax, ε, dense, target_acceptance, blocks)
+    K = mass_matrix_K(Minv)
+    dKdp = mass_matrix_dKdp(Minv)
+    momentum_generator = mass_matrix_momentum_generator(Minv, blocks)
+    H, pall, qall, accepted = HMC_vector(q, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε, blocks, burn_in, thin)
+    return H, pall, qall, accepted, ε, Minv
+
+def adapt_mass_matrix(q0, U, dUdq, integrator, nwarmup, tmax, ε, dense=False, target_acceptance=0.65, blocks=None):
+    q = numpy.array(q0, dtype=float)
+    ndim = len(q)
+    Minv = numpy.eye(ndim) if dense else numpy.ones(ndim)
+    init_buffer, windows, term_buffer = warmup_windows(nwarmup)
+    for k, nwindow in enumerate([init_buffer] + windows + [term_buffer]):
+        K = mass_matrix_K(Minv)
+        dKdp = mass_matrix_dKdp(Minv)
+        momentum_generator = mass_matrix_momentum_generator(Minv, blocks)
+        q, ε, qall = dual_averaging_stepsize(q, U, K, dUdq, dKdp, integrator, momentum_generator, nwindow, tmax, ε, target_acceptance, blocks)
+        if 0 < k <= len(windows) and nwindow > 1:
+            Minv = regularized_covariance(qall, dense)
+    return q, ε, Minv
+
+# sizes of the initial buffer, the doubling slow windows starting at base_window, the last of which is
+# extended to the terminal buffer, and the terminal buffer. Warmups too short for the default buffers
+# use 15% and 10% of nwarmup for the initial and terminal buffers and one window.
+def warmup_windows(nwarmup, init_buffer=75, term_buffer=50, base_window=25):
+    if nwarmup < init_buffer + term_buffer + base_window:
+        init_buffer = int(0.15*nwarmup)
+        term_buffer = int(0.1*nwarmup)
+        base_window = nwarmup - init_buffer - term_buffer
+    windows = []
+    start = init_buffer
+    end = nwarmup - term_buffer
+    nwindow = base_window
+    while start < end:
+        if start + 3*nwindow > end:
+            nwindow = end - start
+        windows.append(nwindow)
+        start += nwindow
+        nwindow *= 2
+    return init_buffer, windows, term_buffer
+
+# sample covariance, or variance if dense is False, shrunk toward 1.0e-3 for small windows
+def regularized_covariance(samples, dense):
+    nsample = len(samples)
+    if dense:
+        cov = numpy.cov(samples, rowvar=False)
+        return (nsample*cov + 1.0e-3*5.0*numpy.eye(len(cov))) / (nsample + 5.0)
+    var = numpy.var(samples, axis=0, ddof=1)
+    return (nsample*var + 1.0e-3*5.0) / (nsample + 5.0)
+
+# Kinetic energy, gradient and momentum generator for the inverse mass matrix Minv of any dimension,
+# either an (ndim, ndim) matrix or an array of ndim diagonal elements. The momentum is drawn from
+# N(0, M) as z @ inv(L) with z a unit normal and Minv = LLᵀ. The generator returns a single
+# momentum vector or, given nchain, an (nchain, ndim) array.
+def mass_matrix_K(Minv):
+    if numpy.ndim(Minv) == 1:
+        def f(p):
+            return numpy.sum(p**2*Minv, axis=-1) / 2.0
+        return f
+    def f(p):
+        return numpy.sum(p*(p @ Minv), axis=-1) / 2.0
+    return f
+
+def mass_matrix_dKdp(Minv):
+    if numpy.ndim(Minv) == 1:
+        def f(p):
+            return p*Minv
+        return f
+    def f(p):
+        return p @ Minv
+    return f
+
+def mass_matrix_momentum_generator(Minv, blocks=None):
+    normal = numpy.random.standard_normal if blocks is None else blocks.generator.standard_normal
+    ndim = len(Minv)
+    if numpy.ndim(Minv) == 1:
+        σ = 1.0/numpy.sqrt(Minv)
+        def f(*nchain):
+            return σ*normal(nchain + (ndim,))
+        return f
+    L_inv = numpy.linalg.inv(numpy.linalg.cholesky(Minv))
+    def f(*nchain):
+        return normal(nchain + (ndim,)) @ L_inv
+    return f
+
+# No-U-Turn sampler using the whole vector interface of HMC_vector and multinomial sampling of the
+# trajectory. Each draw doubles the trajectory in a random direction until the U-turn criterion
+# dKdp(p)·ρ <= 0 holds at either end, where ρ is the summed momentum of the trajectory or of any balanced
+# subtree, the energy error exceeds Δmax, which is reported as a divergence, or max_depth doublings have
+# been made. The first burn_in steps are discarded and then every thin'th step is stored. Returns H, p and
+# q for the retained steps and the tree depth, gradient evaluations and divergence of every step.
+def NUTS(q0, U, K, dUdq, dKdp, momentum_generator, nsample, ε, max_depth=10, Δmax=1000.0, blocks=None, burn_in=0, thin=1):
+    uniform = numpy.random.rand if blocks is None else blocks.uniform
+    current_q = numpy.array(q0, dtype=float)
+    current_U = U(current_q)
+    current_ΔU = dUdq(current_q)
+    ndim = len(current_q)
+
+    nretained = (nsample - burn_in)//thin
+    H = numpy.zeros(nretained)
+    qall = numpy.zeros((nretained, ndim))
+    pall = numpy.zeros((nretained, ndim))
+    tree_depth = numpy.zeros(nsample, dtype=int)
+    ngradient = numpy.zeros(nsample, dtype=int)
+    divergent = numpy.zeros(nsample, dtype=bool)
+
+    for i in range(nsample):
+        current_p = momentum_generator()
+        current_K = K(current_p)
+        H0 = current_U + current_K
+
+        # the trajectory is [left, right] with log weight log_w, summed momentum ρ and multinomial proposal
+        left = right = (current_p, current_q, current_ΔU)
+        log_w = 0.0
+        ρ = numpy.array(current_p, dtype=float)
+        proposal = (current_p, current_q, current_U, current_ΔU)
+
+        for depth in range(max_depth):
+            direction = 1.0 if uniform() < 0.5 else -1.0
+            start = right if direction > 0.0 else left
+            edge, subtree_log_w, subtree_ρ, subtree_proposal, nleaf, stop, diverged = \
+                nuts_subtree(start, U, K, dUdq, dKdp, direction*ε, depth, H0, Δmax, uniform)
+            ngradient[i] += nleaf
+            tree_depth[i] = depth + 1
+            if diverged:
+                divergent[i] = True
+                break
+            if stop:
+                break
+
+            # the subtree proposal replaces the current proposal with probability min(1, w_subtree/w_tree)
+            if numpy.log(uniform()) < subtree_log_w - log_w:
+                proposal = subtree_proposal
+            log_w = numpy.logaddexp(log_w, subtree_log_w)
+            ρ += subtree_ρ
+            if direction > 0.0:
+                right = edge
+            else:
+                left = edge
+            if nuts_turning(left[0], right[0], ρ, dKdp):
+                break
+
+        sample_p, current_q, current_U, current_ΔU = proposal
+
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            k = (i - burn_in)//thin
+            qall[k] = current_q
+            pall[k] = sample_p
+            H[k] = current_U + current_K
+
+    return H, pall, qall, tree_depth, ngradient, divergent
+
+# U-turn criterion for a trajectory with end momenta p_left, p_right and summed momentum ρ
+def nuts_turning(p_left, p_right, ρ, dKdp):
+    return numpy.dot(dKdp(p_left), ρ) <= 0.0 or numpy.dot(dKdp(p_right), ρ) <= 0.0
+
+# Build a subtree of 2**depth leapfrog steps of size ε from the edge (p, q, ΔU) of the trajectory. The
+# subtree is built iteratively leaf by leaf. The momentum and running momentum sum at the first leaf of
+# every balanced subtree are kept as checkpoints so that the U-turn criterion can be checked for each
+# balanced subtree ending at the current leaf. Leaves are sampled uniformly in proportion to exp(H0 - H).
+# Returns the new edge, the log weight, summed momentum and proposal of the subtree, the number of
+# leapfrog steps taken and whether a U-turn or divergence stopped it.
+def nuts_subtree(edge, U, K, dUdq, dKdp, ε, depth, H0, Δmax, uniform):
+    p, q, ΔU = edge
+    p_checkpoints = [None]*(depth + 1)
+    ρ_checkpoints = [None]*(depth + 1)
+    log_w = -numpy.inf
+    ρ = numpy.zeros(len(p))
+    proposal = None
+
+    for n in range(2**depth):
+        p, q, q_U, ΔU = momentum_verlet_energy_integrator(p, q, ΔU, U, dUdq, dKdp, 1, ε)
+        leaf_log_w = H0 - q_U - K(p)
+        if not leaf_log_w > -Δmax:
+            return (p, q, ΔU), log_w, ρ, proposal, n + 1, False, True
+
+        log_w = numpy.logaddexp(log_w, leaf_log_w)
+        if numpy.log(uniform()) < leaf_log_w - log_w:
+            proposal = (p, q, q_U, ΔU)
+        ρ = ρ + p
+
+        # leaf n closes the balanced subtrees starting at checkpoints imin..imax
+        imax = bin(n >> 1).count("1")
+        imin = imax - (~n & (n + 1)).bit_length() + 2
+        if n % 2 == 0:
+            p_checkpoints[imax] = p
+            ρ_checkpoints[imax] = ρ - p
+        for j in range(imax, imin - 1, -1):
+            if nuts_turning(p_checkpoints[j], p, ρ - ρ_checkpoints[j], dKdp):
+                return (p, q, ΔU), log_w, ρ, proposal, n + 1, True, False
+
+    return (p, q, ΔU), log_w, ρ, proposal, 2**depth, False, False
+
+# Streaming Hamiltonian Monte Carlo that generates nsample samples in chunks of chunksize and yields
+# H, p and q for each chunk with the running accepted count. The chain position and its potential
+# energy carry over between chunks.
+
+def HMC_stream(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε, chunksize=65536, blocks=None):
+    q = numpy.array(q0, dtype=float)
+    current_U = None
+    accepted = 0
+    for i in range(0, nsample, chunksize):
+        H, pall, qall, chunk_accepted, current_U = _HMC(q, U, K, dUdq, dKdp, integrator, momentum_generator, min(chunksize, nsample - i), tmax, ε, blocks, U0=current_U)
+        q = qall[-1].copy()
+        accepted += chunk_accepted
+        yield H, pall, qall, accepted
+
+# Continue the chain in the ChainState state for nsample further HMC steps, appending the q samples to
+# the file at path in chunks of chunksize. The state is updated after each chunk and saved to state_path
+# if it is given. momentum_generator must draw from state.blocks for the continued chain to be reproducible.
+# The chain starts from the cached potential energy -state.log_density so U is not evaluated again.
+
+def HMC_resume(U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε, state, path, state_path=None, chunksize=65536):
+    chain_state.truncate_samples(path, state.iteration*numpy.size(state.position))
+    for i in range(0, nsample, chunksize):
+        H, pall, qall, chunk_accepted, current_U = _HMC(state.position, U, K, dUdq, dKdp, integrator, momentum_generator, min(chunksize, nsample - i), tmax, ε, state.blocks, U0=-state.log_density)
+        chain_state.append_samples(path, qall)
+        state.position = qall[-1].copy()
+        state.log_density = -current_U
+        state.iteration += len(qall)
+        state.accepted += chunk_accepted
+        if state_path is not None:
+            state.save(state_path)
+    return state
+
 # Bivariate Normal Distributution Potential Energy and Kinetic Energy
 
 # %%
@@ -107,6 +606,42 @@ def bivariate_normal_dKdp(m1, m2):
             return p[1]/m2
     return f
 
+# whole vector energies and gradients for momentum_verlet_vector_integrator and HMC_chains that
+# also accept (..., 2) arrays
+def bivariate_normal_U_vector(γ, σ1, σ2):
+    scale = σ1**2*σ2**2*(1.0 - γ**2)
+    def f(q):
+        q1 = q[..., 0]
+        q2 = q[..., 1]
+        return ((q1*σ2)**2 + (q2*σ1)**2 - 2.0*q1*q2*σ1*σ2*γ) / (2.0*scale)
+    return f
+
+def bivariate_normal_K_vector(m1, m2):
+    def f(p):
+        return (p[..., 0]**2/m1 + p[..., 1]**2/m2) / 2.0
+    return f
+
+def bivariate_normal_dUdq_vector(γ, σ1, σ2):
+    scale = σ1**2*σ2**2*(1.0 - γ**2)
+    P = numpy.array([[σ2**2, -γ*σ1*σ2], [-γ*σ1*σ2, σ1**2]]) / scale
+    def f(q):
+        return q @ P
+    return f
+
+def bivariate_normal_dKdp_vector(m1, m2):
+    m = numpy.array([m1, m2])
+    def f(p):
+        return p / m
+    return f
+
+# momentum_generator() returns a single momentum vector and momentum_generator(nchain) an (nchain, 2) array
+def bivariate_normal_momentum_vector_generator(m1, m2, blocks=None):
+    σ = numpy.sqrt(numpy.array([m1, m2]))
+    normal = numpy.random.standard_normal if blocks is None else blocks.generator.standard_normal
+    def f(*nchain):
+        return σ*normal(nchain + (2,))
+    return f
+
 def bivariate_normal_momentum_generator(m1, m2):
     def f(n):
         if n == 0:
@@ -115,6 +650,12 @@ def bivariate_normal_momentum_generator(m1, m2):
             return numpy.random.normal(0.0, numpy.sqrt(m2))
     return f
 
+def bivariate_normal_momentum_block_generator(m1, m2, blocks):
+    σ = [numpy.sqrt(m1), numpy.sqrt(m2)]
+    def f(n):
+        return σ[n]*blocks.normal()
+    return f
+
 # Plots
 
 def canonical_distribution(kinetic_energy, potential_energy):
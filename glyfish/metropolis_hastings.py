@@ -1,81 +1,531 @@
+import functools
+import math
 import numpy
-import scipy
 from matplotlib import pyplot
 from glyfish import config
 from glyfish import stats
+from glyfish import chain_state
 
-# Metropolis Hastings samplind algorithm
-def metropolis_hastings(p, q, qsample, stepsize, nsample, x0):
+# Metropolis Hastings samplind algorithm. If blocks is a RandomBlocks instance acceptance uniforms
+# are taken from it, otherwise from numpy.random. The first burn_in steps are discarded and then
+# every thin'th step is stored, giving (nsample - burn_in)//thin samples. accepted counts all steps.
+def metropolis_hastings(p, q, qsample, stepsize, nsample, x0, blocks=None, burn_in=0, thin=1):
+    uniform = numpy.random.rand if blocks is None else blocks.uniform
+    symmetric = is_symmetric(q)
     x = x0
     accepted = 0
-    samples = numpy.zeros(nsample)
+    samples = numpy.zeros((nsample - burn_in)//thin)
     for i in range(nsample):
-        accept = numpy.random.rand()
+        accept = uniform()
         y_star = qsample(x, stepsize)
         py_star = p(y_star)
         px = p(x)
-        α = (py_star*q(y_star, x, stepsize)) / (px*q(x, y_star, stepsize))
+        if symmetric:
+            α = py_star / px
+        else:
+            α = (py_star*q(y_star, x, stepsize)) / (px*q(x, y_star, stepsize))
         if accept < α:
             accepted += 1
             x = y_star
-        samples[i] = x
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            samples[(i - burn_in)//thin] = x
     return samples, accepted
 
 # Component wise Metropolis Hastings samplind algorithm
-def component_metropolis_hastings(p, q, qsample, stepsize, nsample, x0):
+def component_metropolis_hastings(p, q, qsample, stepsize, nsample, x0, blocks=None, burn_in=0, thin=1):
+    uniform = numpy.random.rand if blocks is None else blocks.uniform
+    symmetric = is_symmetric(q)
     accepted = 0
     ndim = len(x0)
-    samples = numpy.zeros((nsample, ndim))
+    samples = numpy.zeros(((nsample - burn_in)//thin, ndim))
     x_current = x0
     for i in range(nsample):
         for j in range(ndim):
-            accept = numpy.random.rand()
+            accept = uniform()
             x = x_current[j]
             y_star = qsample(x, stepsize)
             py_star = p(y_star, j, x_current)
             px = p(x, j, x_current)
-            α = (py_star*q(y_star, x, stepsize)) / (px*q(x, y_star, stepsize))
+            if symmetric:
+                α = py_star / px
+            else:
+                α = (py_star*q(y_star, x, stepsize)) / (px*q(x, y_star, stepsize))
             if accept < α:
                 accepted += 1
                 x = y_star
             x_current[j] = x
-        samples[i] = x_current
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            samples[(i - burn_in)//thin] = x_current
+    return samples, accepted
+
+# Metropolis Hastings samplind algorithm using log densities. log p(x) of the current state is
+# kept across iterations and only recomputed when a proposal is accepted.
+def metropolis_hastings_log(log_p, log_q, qsample, stepsize, nsample, x0, blocks=None, burn_in=0, thin=1):
+    samples, accepted, _ = _metropolis_hastings_log(log_p, log_q, qsample, stepsize, nsample, x0, blocks, burn_in, thin)
+    return samples, accepted
+
+# metropolis_hastings_log kernel for the stream and resume samplers. If log_px0, the value of log_p(x0),
+# is given it is not evaluated again and the final value of log p(x) is returned with the samples so
+# that a continued chain can start from it.
+def _metropolis_hastings_log(log_p, log_q, qsample, stepsize, nsample, x0, blocks=None, burn_in=0, thin=1, log_px0=None):
+    log_uniform = numpy_log_uniform if blocks is None else blocks.log_uniform
+    symmetric = is_symmetric(log_q)
+    x = x0
+    log_px = log_p(x) if log_px0 is None else log_px0
+    accepted = 0
+    samples = numpy.zeros((nsample - burn_in)//thin)
+    for i in range(nsample):
+        log_accept = log_uniform()
+        y_star = qsample(x, stepsize)
+        log_py_star = log_p(y_star)
+        if symmetric:
+            log_α = log_py_star - log_px
+        else:
+            log_α = log_py_star + log_q(y_star, x, stepsize) - log_px - log_q(x, y_star, stepsize)
+        if log_accept < log_α:
+            accepted += 1
+            x = y_star
+            log_px = log_py_star
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            samples[(i - burn_in)//thin] = x
+    return samples, accepted, log_px
+
+# Component wise Metropolis Hastings samplind algorithm using log densities. log_p(x, j, x_current)
+# must be the joint log density with component j of x_current replaced by x so that the value
+# at the current state is the same for every component and can be kept across updates.
+def component_metropolis_hastings_log(log_p, log_q, qsample, stepsize, nsample, x0, blocks=None, burn_in=0, thin=1):
+    samples, accepted, _ = _component_metropolis_hastings_log(log_p, log_q, qsample, stepsize, nsample, x0, blocks, burn_in, thin)
+    return samples, accepted
+
+def _component_metropolis_hastings_log(log_p, log_q, qsample, stepsize, nsample, x0, blocks=None, burn_in=0, thin=1, log_px0=None):
+    log_uniform = numpy_log_uniform if blocks is None else blocks.log_uniform
+    symmetric = is_symmetric(log_q)
+    accepted = 0
+    ndim = len(x0)
+    samples = numpy.zeros(((nsample - burn_in)//thin, ndim))
+    x_current = x0
+    log_px = log_p(x_current[0], 0, x_current) if log_px0 is None else log_px0
+    for i in range(nsample):
+        for j in range(ndim):
+            log_accept = log_uniform()
+            x = x_current[j]
+            y_star = qsample(x, stepsize)
+            log_py_star = log_p(y_star, j, x_current)
+            if symmetric:
+                log_α = log_py_star - log_px
+            else:
+                log_α = log_py_star + log_q(y_star, x, stepsize) - log_px - log_q(x, y_star, stepsize)
+            if log_accept < log_α:
+                accepted += 1
+                x = y_star
+                log_px = log_py_star
+            x_current[j] = x
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            samples[(i - burn_in)//thin] = x_current
+    return samples, accepted, log_px
+
+# Independence Metropolis Hastings sampling algorithm for proposals that do not depend on the chain
+# state, such as normal_independence_generator. All nsample proposals are drawn with one call
+# qsample(x0, stepsize, nsample), which must return an array of nsample proposals, and their importance
+# weights log p(y) - log q(y) computed with one call each of log_p and log_q, which must accept arrays,
+# leaving only the accept/reject recurrence in the loop.
+def independence_metropolis_hastings(log_p, log_q, qsample, stepsize, nsample, x0, blocks=None, burn_in=0, thin=1):
+    y = qsample(x0, stepsize, nsample)
+    log_w = (log_p(y) - log_q(x0, y, stepsize)).tolist()
+    if blocks is None:
+        log_accept = numpy.log(numpy.random.rand(nsample)).tolist()
+    else:
+        log_accept = (-blocks.generator.standard_exponential(nsample)).tolist()
+    y = y.tolist()
+    x = x0
+    log_wx = log_p(x0) - log_q(x0, x0, stepsize)
+    accepted = 0
+    samples = numpy.zeros((nsample - burn_in)//thin)
+    for i in range(nsample):
+        if log_accept[i] < log_w[i] - log_wx:
+            accepted += 1
+            x = y[i]
+            log_wx = log_w[i]
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            samples[(i - burn_in)//thin] = x
+    return samples, accepted
+
+# Multiple try Metropolis sampling algorithm of Liu, Liang and Wong with ntry normal random walk proposals
+# per step weighted by p(y). The proposals and the ntry-1 reference points drawn around the selected
+# proposal are each evaluated with one call of log_p, which must accept arrays.
+def multiple_try_metropolis(log_p, stepsize, ntry, nsample, x0, blocks=None, burn_in=0, thin=1):
+    generator = numpy.random if blocks is None else blocks.generator
+    x = x0
+    log_px = log_p(x)
+    accepted = 0
+    samples = numpy.zeros((nsample - burn_in)//thin)
+    for i in range(nsample):
+        y_star = x + stepsize*generator.standard_normal(ntry)
+        log_py_star = log_p(y_star)
+        log_wy = numpy.logaddexp.reduce(log_py_star)
+        if log_wy > -numpy.inf:
+            w = numpy.cumsum(numpy.exp(log_py_star - log_wy))
+            j = min(numpy.searchsorted(w, generator.random()*w[-1], side='right'), ntry - 1)
+            x_star = y_star[j] + stepsize*generator.standard_normal(ntry - 1)
+            log_wx = numpy.logaddexp(numpy.logaddexp.reduce(log_p(x_star)), log_px)
+            if -generator.standard_exponential() < log_wy - log_wx:
+                accepted += 1
+                x = y_star[j]
+                log_px = log_py_star[j]
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            samples[(i - burn_in)//thin] = x
+    return samples, accepted
+
+# Delayed rejection Metropolis Hastings sampling algorithm of Tierney and Mira. When a normal random walk
+# proposal with stepsize is rejected a second proposal with stepsize*scale is tried from the same state
+# and accepted with the second stage probability that preserves detailed balance.
+def delayed_rejection_metropolis_hastings(log_p, stepsize, nsample, x0, scale=0.2, blocks=None, burn_in=0, thin=1):
+    log_uniform = numpy_log_uniform if blocks is None else blocks.log_uniform
+    normal = numpy.random.normal if blocks is None else blocks.normal
+    x = x0
+    log_px = log_p(x)
+    accepted = 0
+    samples = numpy.zeros((nsample - burn_in)//thin)
+    for i in range(nsample):
+        y1 = x + stepsize*normal()
+        log_py1 = log_p(y1)
+        log_α1 = log_py1 - log_px
+        if log_uniform() < log_α1:
+            accepted += 1
+            x = y1
+            log_px = log_py1
+        else:
+            y2 = x + scale*stepsize*normal()
+            log_py2 = log_p(y2)
+            if log_py2 > log_py1:
+                log_num = log_py2 + math.log1p(-math.exp(log_py1 - log_py2)) - (y1 - y2)**2/(2.0*stepsize**2)
+                log_den = log_px + math.log1p(-math.exp(log_α1)) - (y1 - x)**2/(2.0*stepsize**2)
+                if log_uniform() < log_num - log_den:
+                    accepted += 1
+                    x = y2
+                    log_px = log_py2
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            samples[(i - burn_in)//thin] = x
     return samples, accepted
 
+# Streaming Metropolis Hastings samplers that generate nsample samples in chunks of chunksize and
+# yield each chunk with the running accepted count. The chain state carries over between chunks
+# so memory use does not grow with nsample. log p(x) of the current state also carries over so
+# log_p is not evaluated again at the start of each chunk.
+def metropolis_hastings_stream(log_p, log_q, qsample, stepsize, nsample, x0, chunksize=65536, blocks=None):
+    x = x0
+    log_px = None
+    accepted = 0
+    for i in range(0, nsample, chunksize):
+        samples, chunk_accepted, log_px = _metropolis_hastings_log(log_p, log_q, qsample, stepsize, min(chunksize, nsample - i), x, blocks, log_px0=log_px)
+        x = samples[-1]
+        accepted += chunk_accepted
+        yield samples, accepted
+
+def component_metropolis_hastings_stream(log_p, log_q, qsample, stepsize, nsample, x0, chunksize=65536, blocks=None):
+    x = numpy.array(x0, dtype=float)
+    log_px = None
+    accepted = 0
+    for i in range(0, nsample, chunksize):
+        samples, chunk_accepted, log_px = _component_metropolis_hastings_log(log_p, log_q, qsample, stepsize, min(chunksize, nsample - i), x, blocks, log_px0=log_px)
+        x = samples[-1].copy()
+        accepted += chunk_accepted
+        yield samples, accepted
+
+# Continue the chain in the ChainState state for nsample further steps of metropolis_hastings_log,
+# appending the samples to the file at path in chunks of chunksize. The state is updated after each
+# chunk and saved to state_path if it is given, so an interrupted run can be resumed from the state
+# returned by chain_state.load_chain_state. Samples written after the last saved state are discarded
+# on resume. qsample must draw from state.blocks for the continued chain to be reproducible. The chain
+# starts from the cached state.log_density so log_p is not evaluated again at state.position.
+def metropolis_hastings_resume(log_p, log_q, qsample, stepsize, nsample, state, path, state_path=None, chunksize=65536):
+    chain_state.truncate_samples(path, state.iteration*numpy.size(state.position))
+    for i in range(0, nsample, chunksize):
+        samples, chunk_accepted, log_px = _metropolis_hastings_log(log_p, log_q, qsample, stepsize, min(chunksize, nsample - i), state.position, state.blocks, log_px0=state.log_density)
+        chain_state.append_samples(path, samples)
+        state.position = samples[-1]
+        state.log_density = log_px
+        state.iteration += len(samples)
+        state.accepted += chunk_accepted
+        if state_path is not None:
+            state.save(state_path)
+    return state
+
+# Blocked Metropolis Hastings sampling algorithm. All components are proposed jointly from a multivariate
+# normal random walk with covariance cov, given either as a full matrix or as a list of the blocks of a
+# block diagonal matrix, and accepted with one evaluation of the joint log density log_p(x) per step
+# instead of one per component.
+def blocked_metropolis_hastings(log_p, cov, nsample, x0, blocks=None, burn_in=0, thin=1):
+    log_uniform = numpy_log_uniform if blocks is None else blocks.log_uniform
+    normal = numpy.random.standard_normal if blocks is None else blocks.generator.standard_normal
+    L = proposal_cholesky(cov)
+    ndim = len(L)
+    x = numpy.array(x0, dtype=float)
+    log_px = log_p(x)
+    accepted = 0
+    samples = numpy.zeros(((nsample - burn_in)//thin, ndim))
+    for i in range(nsample):
+        y_star = x + L @ normal(ndim)
+        log_py_star = log_p(y_star)
+        if log_uniform() < log_py_star - log_px:
+            accepted += 1
+            x = y_star
+            log_px = log_py_star
+        if i >= burn_in and (i - burn_in + 1) % thin == 0:
+            samples[(i - burn_in)//thin] = x
+    return samples, accepted
+
+def proposal_cholesky(cov):
+    if isinstance(cov, (list, tuple)):
+        ndim = sum(len(numpy.atleast_2d(block)) for block in cov)
+        L = numpy.zeros((ndim, ndim))
+        k = 0
+        for block in cov:
+            block = numpy.atleast_2d(block)
+            n = len(block)
+            L[k:k+n, k:k+n] = numpy.linalg.cholesky(block)
+            k += n
+        return L
+    return numpy.linalg.cholesky(numpy.atleast_2d(cov))
+
+# Metropolis Hastings sampling algorithm advancing nchain chains in lock step. The target p,
+# proposal q and generator qsample must accept arrays of chain states, for example
+# stats.weibull_vector and stats.arcsine_vector. stepsize may be
+# a scalar or an array with one value per chain. p(x) of the current states is kept across
+# steps so the target is evaluated once per step.
+def metropolis_hastings_chains(p, q, qsample, stepsize, nsample, x0):
+    symmetric = is_symmetric(q)
+    x = numpy.array(x0, dtype=float)
+    px = p(x)
+    nchain = len(x)
+    accepted = numpy.zeros(nchain, dtype=int)
+    samples = numpy.zeros((nchain, nsample))
+    for i in range(nsample):
+        accept = numpy.random.rand(nchain)
+        y_star = qsample(x, stepsize)
+        py_star = p(y_star)
+        if symmetric:
+            α = py_star / px
+        else:
+            α = (py_star*q(y_star, x, stepsize)) / (px*q(x, y_star, stepsize))
+        accepted_step = accept < α
+        accepted += accepted_step
+        x = numpy.where(accepted_step, y_star, x)
+        px = numpy.where(accepted_step, py_star, px)
+        samples[:, i] = x
+    return samples, accepted
+
+# Parallel tempering. Replicas of a normal random walk Metropolis chain targeting log_p(x)/T for each
+# temperature in the ladder T, with T[0] = 1 the target, advance in lock step as arrays so log_p must
+# accept arrays. stepsize may be a scalar or an array with one value per temperature. Every nswap steps
+# swaps of neighbouring replicas are proposed, alternating between even and odd pairs. Returns the
+# (ntemp, nsample) samples, accepted counts per replica and the swap acceptance rate of each pair
+# (T[k], T[k+1]) which is used to tune the ladder.
+def parallel_tempering(log_p, T, stepsize, nsample, x0, nswap=1, blocks=None):
+    generator = numpy.random if blocks is None else blocks.generator
+    β = 1.0/numpy.array(T, dtype=float)
+    ntemp = len(β)
+    x = numpy.zeros(ntemp) + x0
+    log_px = log_p(x)
+    accepted = numpy.zeros(ntemp, dtype=int)
+    swap_proposed = numpy.zeros(ntemp - 1, dtype=int)
+    swap_accepted = numpy.zeros(ntemp - 1, dtype=int)
+    samples = numpy.zeros((ntemp, nsample))
+    for i in range(nsample):
+        y_star = x + stepsize*generator.standard_normal(ntemp)
+        log_py_star = log_p(y_star)
+        with numpy.errstate(invalid='ignore'):
+            accepted_step = -generator.standard_exponential(ntemp) < β*(log_py_star - log_px)
+        accepted += accepted_step
+        x = numpy.where(accepted_step, y_star, x)
+        log_px = numpy.where(accepted_step, log_py_star, log_px)
+        if (i + 1) % nswap == 0:
+            j = numpy.arange((i // nswap) % 2, ntemp - 1, 2)
+            log_α = (β[j] - β[j+1])*(log_px[j+1] - log_px[j])
+            k = j[-generator.standard_exponential(len(j)) < log_α]
+            x[k], x[k+1] = x[k+1], x[k]
+            log_px[k], log_px[k+1] = log_px[k+1], log_px[k]
+            swap_proposed[j] += 1
+            swap_accepted[k] += 1
+        samples[:, i] = x
+    return samples, accepted, swap_accepted/numpy.maximum(swap_proposed, 1)
+
+def geometric_temperatures(tmax, ntemp):
+    return tmax**numpy.linspace(0.0, 1.0, ntemp)
+
+# Adaptive Metropolis sampling algorithm for a univariate target using a normal random walk proposal.
+# During nwarmup iterations log(stepsize) is tuned by Robbins-Monro updates toward target_acceptance.
+# The stepsize is then frozen and nsample samples are generated by metropolis_hastings_log.
+def adaptive_metropolis_hastings(log_p, stepsize, nwarmup, nsample, x0, target_acceptance=0.44, blocks=None):
+    x, stepsize = adapt_stepsize(log_p, stepsize, nwarmup, x0, target_acceptance, blocks)
+    generator = normal_generator if blocks is None else normal_block_generator(blocks)
+    samples, accepted = metropolis_hastings_log(log_p, normal_log_proposal, generator, stepsize, nsample, x, blocks)
+    return samples, accepted, stepsize
+
+def adapt_stepsize(log_p, stepsize, nwarmup, x0, target_acceptance=0.44, blocks=None):
+    log_uniform = numpy_log_uniform if blocks is None else blocks.log_uniform
+    normal = numpy.random.normal if blocks is None else blocks.normal
+    x = x0
+    log_px = log_p(x)
+    log_stepsize = numpy.log(stepsize)
+    for i in range(nwarmup):
+        y_star = x + numpy.exp(log_stepsize)*normal()
+        log_py_star = log_p(y_star)
+        log_α = log_py_star - log_px
+        if log_uniform() < log_α:
+            x = y_star
+            log_px = log_py_star
+        log_stepsize += (min(1.0, numpy.exp(log_α)) - target_acceptance) / (i + 1)**0.6
+    return x, numpy.exp(log_stepsize)
+
+# Adaptive Metropolis sampling algorithm of Haario et. al. for a multivariate target log_p(x).
+# During nwarmup iterations the mean and covariance of the chain are estimated recursively and
+# the proposal scale is tuned by Robbins-Monro updates toward target_acceptance. The proposal
+# covariance is then frozen and nsample samples are generated.
+def adaptive_metropolis(log_p, stepsize, nwarmup, nsample, x0, target_acceptance=0.234, blocks=None):
+    x, cov = adapt_covariance(log_p, stepsize, nwarmup, x0, target_acceptance, blocks)
+    samples, accepted = blocked_metropolis_hastings(log_p, cov, nsample, x, blocks)
+    return samples, accepted, cov
+
+def adapt_covariance(log_p, stepsize, nwarmup, x0, target_acceptance=0.234, blocks=None):
+    log_uniform = numpy_log_uniform if blocks is None else blocks.log_uniform
+    normal = numpy.random.standard_normal if blocks is None else blocks.generator.standard_normal
+    ndim = len(x0)
+    x = numpy.array(x0, dtype=float)
+    log_px = log_p(x)
+    μ = x.copy()
+    cov = numpy.eye(ndim)*stepsize**2
+    jitter = numpy.eye(ndim)*1.0e-10
+    log_λ = numpy.log(2.38/numpy.sqrt(ndim))
+    L = numpy.linalg.cholesky(cov)
+    for i in range(nwarmup):
+        y_star = x + numpy.exp(log_λ)*(L @ normal(ndim))
+        log_py_star = log_p(y_star)
+        log_α = log_py_star - log_px
+        if log_uniform() < log_α:
+            x = y_star
+            log_px = log_py_star
+        γ = 1.0 / (i + 2)**0.6
+        log_λ += γ*(min(1.0, numpy.exp(log_α)) - target_acceptance)
+        δ = x - μ
+        μ += γ*δ
+        cov += γ*(numpy.outer(δ, δ) - cov)
+        L = numpy.linalg.cholesky(cov + jitter)
+    return x, numpy.exp(2.0*log_λ)*(cov + jitter)
+
+# log of acceptance uniform drawn from numpy.random
+def numpy_log_uniform():
+    return numpy.log(numpy.random.rand())
+
 # Proposal generators
 def normal_generator(x, stepsize):
     return numpy.random.normal(x, stepsize)
 
-def normal_independence_generator(μ):
+def normal_block_generator(blocks):
     def f(x, stepsize):
-        return numpy.random.normal(μ, stepsize)
+        return x + stepsize*blocks.normal()
+    return f
+
+# Independence generators draw a single proposal, an array of the shape of x if x is an array or
+# size proposals if size is given, as independence_metropolis_hastings does.
+def normal_independence_generator(μ):
+    def f(x, stepsize, size=None):
+        if size is None and numpy.ndim(x) > 0:
+            size = numpy.shape(x)
+        return numpy.random.normal(μ, stepsize, size)
+    return f
+
+def normal_independence_block_generator(μ, blocks):
+    def f(x, stepsize, size=None):
+        if size is None and numpy.ndim(x) > 0:
+            size = numpy.shape(x)
+        if size is not None:
+            return μ + stepsize*blocks.generator.standard_normal(size)
+        return μ + stepsize*blocks.normal()
     return f
 
 def gamma_generator(x, stepsize):
+    if numpy.ndim(x) > 0:
+        return numpy.random.gamma(numpy.maximum(x, 0.0)/stepsize, stepsize)
     if x <= 0 or stepsize <= 0:
         return 0.0
-    return scipy.stats.gamma.rvs(x/stepsize, scale=stepsize)
+    return numpy.random.gamma(x/stepsize, stepsize)
+
+def gamma_block_generator(blocks):
+    def f(x, stepsize):
+        if numpy.ndim(x) > 0:
+            return blocks.generator.gamma(numpy.maximum(x, 0.0)/stepsize, stepsize)
+        if x <= 0 or stepsize <= 0:
+            return 0.0
+        return blocks.generator.gamma(x/stepsize, stepsize)
+    return f
 
 def uniform_generator(x, stepsize):
-    return numpy.random.rand()
+    return numpy.random.rand(*numpy.shape(x))
+
+def uniform_block_generator(blocks):
+    def f(x, stepsize):
+        return blocks.uniform()
+    return f
+
+# Proposals declare q(x, y) = q(y, x) with the symmetric decorator so that the samplers can
+# skip the Hastings correction
+def symmetric(q):
+    q.symmetric = True
+    return q
+
+def is_symmetric(q):
+    return getattr(q, "symmetric", False)
 
 # Proposal distributions
+@symmetric
 def normal_proposal(x, y, stepsize):
     ε = ((y - x)**2) / (2.0 * stepsize**2)
     return numpy.exp(-ε) / numpy.sqrt(2 * numpy.pi * stepsize**2)
 
 def gamma_proposal(x, y, stepsize):
-    return scipy.stats.gamma.pdf(y, x/stepsize, scale=stepsize)
+    return numpy.exp(gamma_log_proposal(x, y, stepsize))
 
+@symmetric
 def uniform_proposal(x, y, stepsize):
     return 1.0
 
 def normal_independence_proposal(μ):
-    def f(x, stepsize):
+    def f(x, y, stepsize):
         ε = ((y - μ)**2) / (2.0 * stepsize**2)
         return numpy.exp(-ε) / numpy.sqrt(2 * numpy.pi * stepsize**2)
     return f
 
+# Proposal log densities
+@symmetric
+def normal_log_proposal(x, y, stepsize):
+    return -((y - x)**2) / (2.0 * stepsize**2) - 0.5*numpy.log(2 * numpy.pi * stepsize**2)
+
+# the gamma normalization depends only on the shape x/stepsize so the value for the current
+# state is cached and reused until a proposal is accepted. Arrays are evaluated in one call.
+def gamma_log_proposal(x, y, stepsize):
+    if numpy.ndim(x) > 0 or numpy.ndim(y) > 0:
+        a = numpy.maximum(x, 0.0)/stepsize
+        with numpy.errstate(divide='ignore'):
+            return numpy.where(x <= 0.0, -numpy.inf, stats.gamma_log_density(y, a, stepsize))
+    if x <= 0.0 or y <= 0.0:
+        return -numpy.inf
+    a = x/stepsize
+    return (a - 1.0)*math.log(y) - y/stepsize - gamma_log_normalization(a, stepsize)
+
+@functools.lru_cache(maxsize=4)
+def gamma_log_normalization(a, θ):
+    return math.lgamma(a) + a*math.log(θ)
+
+@symmetric
+def uniform_log_proposal(x, y, stepsize):
+    return 0.0
+
+def normal_independence_log_proposal(μ):
+    def f(x, y, stepsize):
+        return -((y - μ)**2) / (2.0 * stepsize**2) - 0.5*numpy.log(2 * numpy.pi * stepsize**2)
+    return f
+
 # Plots
 def acceptance(title, x, y, xlim, example_idx, post, plot):
     figure, axis = pyplot.subplots(figsize=(10, 7))
@@ -0,0 +1,53 @@
+import numpy
+from scipy import linalg
+
+# Multivariate normal distribution with mean μ and covariance cov in any dimension. The Cholesky factor
+# cov = LLᵀ, its inverse and the precision are computed once when the target is created. Points are
+# arrays with shape (..., ndim) so a batch of points is evaluated in one call. U and dUdq are the
+# potential energy and its gradient for the whole vector HMC samplers, for example
+# hmc.HMC_vector(q0, target.U, K, target.dUdq, dKdp, ...), and conditional_sample is the Gibbs update of
+# one component.
+class MultivariateNormal:
+    def __init__(self, μ, cov):
+        self.cov = numpy.atleast_2d(numpy.array(cov, dtype=float))
+        self.ndim = len(self.cov)
+        self.μ = numpy.zeros(self.ndim) + μ
+        self.L = numpy.linalg.cholesky(self.cov)
+        self.L_inv = linalg.solve_triangular(self.L, numpy.eye(self.ndim), lower=True)
+        self.precision = self.L_inv.T @ self.L_inv
+        self.log_c = 0.5*self.ndim*numpy.log(2.0*numpy.pi) + numpy.sum(numpy.log(numpy.diag(self.L)))
+
+    def log_pdf(self, x):
+        z = (x - self.μ) @ self.L_inv.T
+        return -0.5*numpy.sum(z**2, axis=-1) - self.log_c
+
+    def pdf(self, x):
+        return numpy.exp(self.log_pdf(x))
+
+    def grad_log_pdf(self, x):
+        return -(x - self.μ) @ self.precision
+
+    # potential energy, -log_pdf without the normalization
+    def U(self, q):
+        z = (q - self.μ) @ self.L_inv.T
+        return 0.5*numpy.sum(z**2, axis=-1)
+
+    def dUdq(self, q):
+        return (q - self.μ) @ self.precision
+
+    # nsample exact samples with shape (nsample, ndim)
+    def samples(self, nsample, blocks=None):
+        normal = numpy.random.standard_normal if blocks is None else blocks.generator.standard_normal
+        return self.μ + normal((nsample, self.ndim)) @ self.L.T
+
+    # mean and standard deviation of component j conditioned on the other components of x
+    def conditional(self, x, j):
+        σ2 = 1.0/self.precision[j, j]
+        δ = x - self.μ
+        loc = self.μ[j] - σ2*(δ @ self.precision[j] - self.precision[j, j]*δ[..., j])
+        return loc, numpy.sqrt(σ2)
+
+    def conditional_sample(self, x, j, blocks=None):
+        normal = numpy.random.standard_normal if blocks is None else blocks.generator.standard_normal
+        loc, σ = self.conditional(x, j)
+        return loc + σ*normal(numpy.shape(loc))
@@ -0,0 +1,180 @@
+import functools
+import numpy
+
+# Optional compiled sampler kernels. If numba is installed the sampler loops are JIT compiled together
+# with the log densities, gradients and proposals passed to them, which must themselves be compiled
+# with jit and written in the numpy subset supported by numba. Without numba jit returns the function
+# unchanged and the same kernels run as pure python. Random numbers come from numpy.random seeded by
+# seed, which is numba's own generator when compiled. The pure python kernels seed the global numpy
+# generator, so its state is saved before and restored after each call to leave the caller's stream
+# unchanged, as it is with numba.
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+def jit(f):
+    if numba is None:
+        return f
+    return numba.njit(f)
+
+# jit for kernels that seed numpy.random
+def seeded_jit(f):
+    if numba is not None:
+        return numba.njit(f)
+    @functools.wraps(f)
+    def kernel(*args):
+        state = numpy.random.get_state()
+        try:
+            return f(*args)
+        finally:
+            numpy.random.set_state(state)
+    return kernel
+
+# Metropolis Hastings with a normal random walk proposal on log_p(x)
+@seeded_jit
+def metropolis_hastings_log(log_p, stepsize, nsample, x0, seed):
+    numpy.random.seed(seed)
+    x = x0
+    log_px = log_p(x)
+    accepted = 0
+    samples = numpy.zeros(nsample)
+    for i in range(nsample):
+        y_star = x + stepsize*numpy.random.standard_normal()
+        log_py_star = log_p(y_star)
+        if numpy.log(numpy.random.random()) < log_py_star - log_px:
+            accepted += 1
+            x = y_star
+            log_px = log_py_star
+        samples[i] = x
+    return samples, accepted
+
+# Component wise Metropolis Hastings with normal random walk proposals on log_p(x, j, x_current), the
+# joint log density with component j of x_current replaced by x
+@seeded_jit
+def component_metropolis_hastings_log(log_p, stepsize, nsample, x0, seed):
+    numpy.random.seed(seed)
+    ndim = len(x0)
+    x_current = x0.copy()
+    log_px = log_p(x_current[0], 0, x_current)
+    accepted = 0
+    samples = numpy.zeros((nsample, ndim))
+    for i in range(nsample):
+        for j in range(ndim):
+            y_star = x_current[j] + stepsize*numpy.random.standard_normal()
+            log_py_star = log_p(y_star, j, x_current)
+            if numpy.log(numpy.random.random()) < log_py_star - log_px:
+                accepted += 1
+                x_current[j] = y_star
+                log_px = log_py_star
+        samples[i] = x_current
+    return samples, accepted
+
+# Momentum Verlet integration with per component gradients dUdq(q, j) and dKdp(p, j)
+@jit
+def momentum_verlet_integrator(p0, q0, dUdq, dKdp, nsteps, ε):
+    ndim = len(p0)
+    p = p0.copy()
+    q = q0.copy()
+    for i in range(nsteps):
+        for j in range(ndim):
+            p[j] = p[j] - ε*dUdq(q, j)/2.0
+            q[j] = q[j] + ε*dKdp(p, j)
+            p[j] = p[j] - ε*dUdq(q, j)/2.0
+    return p, q
+
+# Hamiltonian Monte Carlo with the interface of hamiltonian_monte_carlo.HMC
+@seeded_jit
+def HMC(q0, U, K, dUdq, dKdp, integrator, momentum_generator, nsample, tmax, ε, seed):
+    numpy.random.seed(seed)
+    ndim = len(q0)
+    current_q = q0.copy()
+    current_p = numpy.zeros(ndim)
+    H = numpy.zeros(nsample)
+    qall = numpy.zeros((nsample, ndim))
+    pall = numpy.zeros((nsample, ndim))
+    accepted = 0
+    current_U = U(current_q)
+    for i in range(nsample):
+        for j in range(ndim):
+            current_p[j] = momentum_generator(j)
+        nsteps = int(numpy.random.random()*tmax/ε)
+        p, q = integrator(current_p, current_q, dUdq, dKdp, nsteps, ε)
+        p = -p
+        current_K = K(current_p)
+        proposed_U = U(q)
+        α = numpy.exp(current_U - proposed_U + current_K - K(p))
+        if numpy.random.random() < α:
+            current_q = q
+            current_U = proposed_U
+            pall[i] = p
+            accepted += 1
+        else:
+            pall[i] = current_p
+        qall[i] = current_q
+        H[i] = current_U + current_K
+    return H, pall, qall, accepted
+
+# Compiled targets
+
+def weibull_log_pdf(k, λ=1.0):
+    @jit
+    def f(x):
+        if x <= 0.0:
+            return -numpy.inf
+        return numpy.log(k/λ) + (k - 1.0)*numpy.log(x/λ) - (x/λ)**k
+    return f
+
+def bivariate_normal_target_log_pdf(μ1, μ2, σ1, σ2, γ):
+    log_c = numpy.log(2 * numpy.pi * σ1 * σ2 * numpy.sqrt(1.0 - γ**2))
+    @jit
+    def f(x, i, x_current):
+        if i == 0:
+            y1 = (x - μ1) / σ1
+            y2 = (x_current[1] - μ2) / σ2
+        else:
+            y1 = (x_current[0] - μ1) / σ1
+            y2 = (x - μ2) / σ2
+        return -(y1**2 + y2**2 - 2.0 * γ * y1 * y2) / (2.0 * (1.0 - γ**2)) - log_c
+    return f
+
+def bivariate_normal_U(γ, σ1, σ2):
+    scale = σ1**2*σ2**2*(1.0 - γ**2)
+    @jit
+    def f(q):
+        return ((q[0]*σ2)**2 + (q[1]*σ1)**2 - 2.0*q[0]*q[1]*σ1*σ2*γ) / (2.0*scale)
+    return f
+
+def bivariate_normal_K(m1, m2):
+    @jit
+    def f(p):
+        return (p[0]**2/m1 + p[1]**2/m2) / 2.0
+    return f
+
+def bivariate_normal_dUdq(γ, σ1, σ2):
+    scale = σ1**2*σ2**2*(1.0 - γ**2)
+    @jit
+    def f(q, n):
+        if n == 0:
+            return (q[0]*σ2**2 - q[1]*γ*σ1*σ2) / scale
+        return (q[1]*σ1**2 - q[0]*γ*σ1*σ2) / scale
+    return f
+
+def bivariate_normal_dKdp(m1, m2):
+    @jit
+    def f(p, n):
+        if n == 0:
+            return p[0]/m1
+        return p[1]/m2
+    return f
+
+def bivariate_normal_momentum_generator(m1, m2):
+    σ1 = numpy.sqrt(m1)
+    σ2 = numpy.sqrt(m2)
+    @jit
+    def f(n):
+        if n == 0:
+            return numpy.random.normal(0.0, σ1)
+        return numpy.random.normal(0.0, σ2)
+    return f
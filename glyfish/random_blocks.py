@@ -0,0 +1,63 @@
+import json
+import numpy
+
+# Random numbers drawn from a numpy.random.Generator in blocks of blocksize and handed out one
+# at a time as python floats so that sampler loops do not pay a numpy dispatch per scalar draw.
+# The stream is reproducible from seed.
+class RandomBlocks:
+    def __init__(self, seed=None, blocksize=65536):
+        self.generator = numpy.random.default_rng(seed)
+        self.blocksize = blocksize
+        self.uniforms = []
+        self.uniform_idx = blocksize
+        self.log_uniforms = []
+        self.log_uniform_idx = blocksize
+        self.normals = []
+        self.normal_idx = blocksize
+
+    def uniform(self):
+        if self.uniform_idx == self.blocksize:
+            self.uniforms = self.generator.random(self.blocksize).tolist()
+            self.uniform_idx = 0
+        u = self.uniforms[self.uniform_idx]
+        self.uniform_idx += 1
+        return u
+
+    # log(u) for u uniform on (0, 1] is minus a unit exponential
+    def log_uniform(self):
+        if self.log_uniform_idx == self.blocksize:
+            self.log_uniforms = (-self.generator.standard_exponential(self.blocksize)).tolist()
+            self.log_uniform_idx = 0
+        u = self.log_uniforms[self.log_uniform_idx]
+        self.log_uniform_idx += 1
+        return u
+
+    def normal(self):
+        if self.normal_idx == self.blocksize:
+            self.normals = self.generator.standard_normal(self.blocksize).tolist()
+            self.normal_idx = 0
+        z = self.normals[self.normal_idx]
+        self.normal_idx += 1
+        return z
+
+    # state of the bit generator and the current blocks as arrays and strings that can be
+    # written with numpy.savez
+    def get_state(self):
+        return {"blocksize": self.blocksize,
+                "bit_generator": json.dumps(self.generator.bit_generator.state),
+                "uniforms": numpy.array(self.uniforms),
+                "uniform_idx": self.uniform_idx,
+                "log_uniforms": numpy.array(self.log_uniforms),
+                "log_uniform_idx": self.log_uniform_idx,
+                "normals": numpy.array(self.normals),
+                "normal_idx": self.normal_idx}
+
+    def set_state(self, state):
+        self.blocksize = int(state["blocksize"])
+        self.generator.bit_generator.state = json.loads(str(state["bit_generator"]))
+        self.uniforms = state["uniforms"].tolist()
+        self.uniform_idx = int(state["uniform_idx"])
+        self.log_uniforms = state["log_uniforms"].tolist()
+        self.log_uniform_idx = int(state["log_uniform_idx"])
+        self.normals = state["normals"].tolist()
+        self.normal_idx = int(state["normal_idx"])
@@ -1,5 +1,4 @@
 import numpy
-from scipy import stats
 from scipy import special
 
 # distributions
@@ -15,6 +14,13 @@ def weibull(k, λ=1.0):
         return (k/λ)*(x/λ)**(k-1)*numpy.exp(-(x/λ)**k)
     return f
 
+# weibull for arrays of points, used by metropolis_hastings_chains
+def weibull_vector(k, λ=1.0):
+    def f(x):
+        y = numpy.maximum(x, 0.0)/λ
+        return numpy.where(x < 0.0, 0.0, (k/λ)*y**(k-1)*numpy.exp(-y**k))
+    return f
+
 def weibull_mean(k, λ=1.0):
     return λ*special.gamma(1+1.0/k)
 
@@ -26,14 +32,19 @@ def arcsine(x):
         return 0.0
     return 1.0/(numpy.pi*numpy.sqrt(x*(1.0 - x)))
 
+# arcsine for arrays of points, used by metropolis_hastings_chains
+def arcsine_vector(x):
+    y = numpy.clip(x, 0.0, 1.0)
+    with numpy.errstate(divide='ignore'):
+        return numpy.where((x <= 0.0) | (x >= 1.0), 0.0, 1.0/(numpy.pi*numpy.sqrt(y*(1.0 - y))))
+
 def bimodal_normal(x, σ=1.0, μ=1.0):
     return 0.5*(normal(x, σ, -2.0*μ) + normal(x, σ/2.0, 3.0*μ))
 
 def gamma(a, θ=1.0):
+    log_pdf = gamma_log_pdf(a, θ)
     def f(x):
-        if x <= 0 or a <= 0:
-            return 0.0
-        return stats.gamma.pdf(x, a, scale=θ)
+        return numpy.exp(log_pdf(x))
     return f
 
 def gamma_mean(a, σ):
@@ -49,6 +60,44 @@ def bimodal_normal_sigma(σ=1.0, μ=1.0):
     var = 0.5*(1.25*σ**2 + 13.0*μ**2) - 0.25*μ**2
     return numpy.sqrt(var)
 
+# log densities
+
+def normal_log_pdf(x, σ=1.0, μ=0.0):
+    return -(x - μ)**2/(2.0*σ**2) - 0.5*numpy.log(2.0*numpy.pi*σ**2)
+
+def weibull_log_pdf(k, λ=1.0):
+    def f(x):
+        y = numpy.maximum(x, 0.0)/λ
+        with numpy.errstate(divide='ignore'):
+            return numpy.where(x <= 0.0, -numpy.inf, numpy.log(k/λ) + (k-1.0)*numpy.log(y) - y**k)
+    return f
+
+def arcsine_log_pdf(x):
+    y = numpy.clip(x, 0.0, 1.0)
+    with numpy.errstate(divide='ignore'):
+        return numpy.where((x <= 0.0) | (x >= 1.0), -numpy.inf, -numpy.log(numpy.pi) - 0.5*numpy.log(y*(1.0 - y)))
+
+def bimodal_normal_log_pdf(x, σ=1.0, μ=1.0):
+    return numpy.logaddexp(normal_log_pdf(x, σ, -2.0*μ), normal_log_pdf(x, σ/2.0, 3.0*μ)) - numpy.log(2.0)
+
+def gamma_log_pdf(a, θ=1.0):
+    def f(x):
+        if a <= 0:
+            return numpy.full(numpy.shape(x), -numpy.inf)
+        return gamma_log_density(x, a, θ)
+    return f
+
+# closed form log densities with the distribution parameters as arguments so they can be evaluated
+# for arrays of parameters. scipy.stats is only used to validate these.
+
+def gamma_log_density(x, a, θ=1.0):
+    y = numpy.maximum(x, 0.0)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return numpy.where(x <= 0.0, -numpy.inf, (a - 1.0)*numpy.log(y) - y/θ - special.gammaln(a) - a*numpy.log(θ))
+
+def poisson_log_pmf(k, λ):
+    return k*numpy.log(λ) - λ - special.gammaln(k + 1.0)
+
 # utilities
 
 def cummean(samples):
@@ -87,6 +136,30 @@ def autocorrelate(x):
     ac = numpy.fft.ifft(h_fft)
     return ac[0:n]/ac[0]
 
+# update the running count, mean and sum of squared deviations from the mean with a chunk of samples
+# so that moments of a streamed chain can be computed without holding the chain in memory
+def update_moments(n, mean, m2, samples):
+    nchunk = len(samples)
+    chunk_mean = numpy.mean(samples, axis=0)
+    chunk_m2 = numpy.sum((samples - chunk_mean)**2, axis=0)
+    δ = chunk_mean - mean
+    ntotal = n + nchunk
+    mean = mean + δ*nchunk/ntotal
+    m2 = m2 + chunk_m2 + δ**2*n*nchunk/ntotal
+    return ntotal, mean, m2
+
+# effective sample size using Geyer's initial positive sequence estimate of the autocorrelation time
+def effective_sample_size(samples):
+    nsample = len(samples)
+    ac = numpy.real(autocorrelate(samples))
+    npair = nsample // 2
+    Γ = ac[0:2*npair:2] + ac[1:2*npair:2]
+    negative = numpy.where(Γ <= 0.0)[0]
+    if len(negative) > 0:
+        Γ = Γ[:negative[0]]
+    τ = -1.0 + 2.0*numpy.sum(Γ)
+    return nsample / τ
+
 def shift(a, n):
     result = numpy.zeros(a.shape)
     count = len(a)
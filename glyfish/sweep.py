@@ -0,0 +1,47 @@
+import itertools
+import multiprocessing
+import tempfile
+import os
+import numpy
+from glyfish import metropolis_hastings as mh
+from glyfish.random_blocks import RandomBlocks
+
+# Parameter sweep of metropolis_hastings_log over a grid of stepsize, x0, seed and proposal values
+# run in a process pool. Each proposal is a pair (log_q, block_generator) where block_generator(blocks)
+# returns the proposal generator, for example (mh.normal_log_proposal, mh.normal_block_generator).
+# Every configuration uses an independent RandomBlocks stream spawned from its seed and its index
+# in the grid, so runs are reproducible and no two configurations share a stream. Each writes its samples
+# into row i of an (nconfig, nsample) array memory mapped at path. The pool is forked so that log_p
+# and the proposals may be closures.
+
+sweep_state = None
+
+def sweep(log_p, stepsize, x0, seed, proposal, nsample, path=None, nprocess=None, blocksize=65536):
+    global sweep_state
+    configs = list(itertools.product(stepsize, x0, seed, proposal))
+    nconfig = len(configs)
+    if path is None:
+        path = os.path.join(tempfile.mkdtemp(), "sweep.npy")
+    samples = numpy.lib.format.open_memmap(path, mode="w+", dtype=numpy.float64, shape=(nconfig, nsample))
+    del samples
+
+    sweep_state = (log_p, configs, nsample, path, blocksize)
+    try:
+        with multiprocessing.get_context("fork").Pool(nprocess) as pool:
+            accepted = pool.map(run_config, range(nconfig), chunksize=1)
+    finally:
+        sweep_state = None
+
+    samples = numpy.load(path, mmap_mode="r")
+    return samples, numpy.array(accepted), configs
+
+def run_config(i):
+    log_p, configs, nsample, path, blocksize = sweep_state
+    stepsize, x0, seed, proposal = configs[i]
+    log_q, block_generator = proposal
+    blocks = RandomBlocks(numpy.random.SeedSequence(seed, spawn_key=(i,)), blocksize)
+    samples, accepted = mh.metropolis_hastings_log(log_p, log_q, block_generator(blocks), stepsize, nsample, x0, blocks)
+    all_samples = numpy.load(path, mmap_mode="r+")
+    all_samples[i] = samples
+    all_samples.flush()
+    return accepted
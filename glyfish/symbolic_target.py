@@ -0,0 +1,92 @@
+import hashlib
+import os
+import numpy
+import sympy
+
+# NumPyPrinter is in sympy.printing.lambdarepr before sympy 1.2, where it prints numpy functions by bare
+# name, sympy.printing.pycode from 1.2 and sympy.printing.numpy from 1.7
+try:
+    from sympy.printing.numpy import NumPyPrinter
+except ImportError:
+    try:
+        from sympy.printing.pycode import NumPyPrinter
+    except ImportError:
+        from sympy.printing.lambdarepr import NumPyPrinter
+
+# Targets defined by a sympy expression for the potential energy U in the symbols q. The gradient is
+# found by symbolic differentiation, common subexpressions of U and of the gradient are eliminated
+# with sympy.cse and both are printed as numpy source that is compiled into vectorized functions of
+# (..., ndim) arrays. The source is cached in cache_path under the sha256 hash of the expression and
+# symbols so later sessions compile it without differentiating again. A CompiledTarget has the
+# interface of MultivariateNormal so that U and dUdq can be passed to the whole vector HMC samplers.
+
+cache_path = os.path.join(os.path.expanduser("~"), ".cache", "glyfish", "targets")
+
+# version of the generated source, part of the cache key with the sympy version so that source printed
+# by a different generator or printer is not reused
+source_version = 1
+
+# the generated source is run with numpy and its functions by bare name for the printer of old sympy
+source_namespace = {name: getattr(numpy, name) for name in dir(numpy) if not name.startswith("_")}
+source_namespace["numpy"] = numpy
+
+class CompiledTarget:
+    def __init__(self, U, q, cache_dir=None):
+        free_symbols = sympy.sympify(U).free_symbols - set(q)
+        if free_symbols:
+            names = ", ".join(sorted(str(symbol) for symbol in free_symbols))
+            raise ValueError(f"U depends on symbols not in q: {names}, substitute values for them with U.subs")
+        self.ndim = len(q)
+        self.source = target_source(U, q, cache_dir)
+        namespace = dict(source_namespace)
+        exec(compile(self.source, "<glyfish compiled target>", "exec"), namespace)
+        self.U = namespace["U"]
+        self.dUdq = namespace["dUdq"]
+
+    def log_pdf(self, x):
+        return -self.U(x)
+
+    def grad_log_pdf(self, x):
+        return -self.dUdq(x)
+
+def target_hash(U, q):
+    key = f"{source_version}:{sympy.__version__}:" + sympy.srepr(U) + sympy.srepr(tuple(q))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def target_source(U, q, cache_dir=None):
+    cache_dir = cache_path if cache_dir is None else cache_dir
+    path = os.path.join(cache_dir, target_hash(U, q) + ".py")
+    if os.path.exists(path):
+        with open(path) as file:
+            return file.read()
+    source = generate_source(U, q)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}"
+    with open(tmp_path, "w") as file:
+        file.write(source)
+    os.replace(tmp_path, path)
+    return source
+
+# numpy source of U(q) and dUdq(q). The symbols q are renamed q_0, q_1, ... and taken from the last axis
+# of q. Terms that do not depend on q are broadcast to the batch shape.
+def generate_source(U, q):
+    q_symbols = [sympy.Symbol(f"q_{i}") for i in range(len(q))]
+    U = sympy.sympify(U).xreplace(dict(zip(q, q_symbols)))
+    ΔU = [sympy.diff(U, qi) for qi in q_symbols]
+    lines = function_source("U", [U], q_symbols)
+    lines += [""] + function_source("dUdq", ΔU, q_symbols)
+    return "\n".join(lines) + "\n"
+
+def function_source(name, expressions, q_symbols):
+    printer = NumPyPrinter()
+    replacements, reduced = sympy.cse(expressions, symbols=sympy.numbered_symbols("c_"))
+    lines = [f"def {name}(q):",
+             "    zero = numpy.zeros(numpy.shape(q)[:-1])"]
+    lines += [f"    {qi} = q[..., {i}]" for i, qi in enumerate(q_symbols)]
+    lines += [f"    {c} = {printer.doprint(e)}" for c, e in replacements]
+    values = [f"zero + {printer.doprint(e)}" for e in reduced]
+    if len(values) == 1:
+        lines.append(f"    return {values[0]}")
+    else:
+        lines.append(f"    return numpy.stack([{', '.join(values)}], axis=-1)")
+    return lines
@@ -14,20 +14,19 @@ from glyfish import stats
 
 pyplot.style.use(config.glyfish_style)
 
+rng = numpy.random.default_rng()
+
 # %%
 
 def generate_counts_time_series(ncounts, α, β):
-    n = scipy.stats.randint.rvs(0, ncounts)
-    λ1 = scipy.stats.gamma.rvs(α, scale=1.0/β)
-    λ2 = scipy.stats.gamma.rvs(α, scale=1.0/β)
+    n = rng.integers(0, ncounts)
+    λ1 = rng.gamma(α, 1.0/β)
+    λ2 = rng.gamma(α, 1.0/β)
     return n, λ1, λ2, generate_counts_time_series_from_params(ncounts, λ1, λ2, n)
 
 def generate_counts_time_series_from_params(ncounts, λ1, λ2, n):
-    counts = numpy.zeros(ncounts)
-    for i in range(ncounts):
-        λ = λ1 if i < n+1 else λ2
-        counts[i] = scipy.stats.poisson.rvs(λ)
-    return counts
+    λ = numpy.where(numpy.arange(ncounts) < n+1, λ1, λ2)
+    return rng.poisson(λ).astype(float)
 
 def change_point_df_cdf(counts, λ1, λ2):
     ncounts = len(counts)
@@ -54,46 +53,46 @@ def change_point_multinomial_sample(counts, λ1, λ2):
 def lower_λ_pdf(λ, counts, n, α, β):
     α1 = numpy.sum(counts[:n+1]) + α
     β1 = n + β
-    return scipy.stats.gamma.pdf(λ, α1, scale=1.0/β1)
+    return numpy.exp(stats.gamma_log_density(λ, α1, 1.0/β1))
 
 def lower_λ_mean(counts, n, α, β):
     α1 = numpy.sum(counts[:n+1]) + α
     β1 = n + β
-    return scipy.stats.gamma.mean(α1, scale=1.0/β1)
+    return α1/β1
 
 def lower_λ_std(counts, n, α, β):
     α1 = numpy.sum(counts[:n+1]) + α
     β1 = n + β
-    return scipy.stats.gamma.std(α1, scale=1.0/β1)
+    return numpy.sqrt(α1)/β1
 
-def lower_λ_sample(counts, n, α, β):
+def lower_λ_sample(counts, n, α, β, size=None):
     α1 = numpy.sum(counts[:n+1]) + α
     β1 = n + β
-    return scipy.stats.gamma.rvs(α1, scale=1.0/β1)
+    return rng.gamma(α1, 1.0/β1, size)
 
 def upper_λ_pdf(λ, counts, n, α, β):
     ncount = len(counts)
     α2 = numpy.sum(counts[n+1:]) + α
     β2 = ncount - n + β
-    return scipy.stats.gamma.pdf(λ, α2, scale=1.0/β2)
+    return numpy.exp(stats.gamma_log_density(λ, α2, 1.0/β2))
 
 def upper_λ_mean(counts, n, α, β):
     ncount = len(counts)
     α2 = numpy.sum(counts[n+1:]) + α
     β2 = ncount - n + β
-    return scipy.stats.gamma.mean(α2, scale=1.0/β2)
+    return α2/β2
 
 def upper_λ_std(counts, n, α, β):
     ncount = len(counts)
     α2 = numpy.sum(counts[n+1:]) + α
     β2 = ncount - n + β
-    return scipy.stats.gamma.std(α2, scale=1.0/β2)
+    return numpy.sqrt(α2)/β2
 
-def upper_λ_sample(counts, n, α, β):
+def upper_λ_sample(counts, n, α, β, size=None):
     ncount = len(counts)
     α2 = numpy.sum(counts[n+1:]) + α
     β2 = ncount - n + β
-    return scipy.stats.gamma.rvs(α2, scale=1.0/β2)
+    return rng.gamma(α2, 1.0/β2, size)
 
 def mean(x, p, dx):
     return dx*numpy.sum(p*x[1:])
@@ -101,8 +100,12 @@ def mean(x, p, dx):
 def std(x, p, dx):
     return numpy.sqrt(dx*numpy.sum(p*x[1:]**2) - mean(x, p, dx)**2)
 
+# cumulative counts are computed once so that each sweep draws λ1 and λ2 from numpy gamma
+# generators without summing the counts
 def gibbs_sample(counts, n0, λ10, λ20, α, β, nsample):
     ncount = len(counts)
+    cumulative_counts = numpy.cumsum(counts)
+    total_counts = cumulative_counts[-1]
     n = numpy.zeros(nsample, dtype=int)
     λ1 = numpy.zeros(nsample)
     λ2 = numpy.zeros(nsample)
@@ -110,8 +113,9 @@ def gibbs_sample(counts, n0, λ10, λ20, α, β, nsample):
     λ1[0] = λ10
     λ2[0] = λ20
     for i in range(1, nsample):
-        λ1[i] = lower_λ_sample(counts, n[i-1], α, β)
-        λ2[i] = upper_λ_sample(counts, n[i-1], α, β)
+        lower_counts = cumulative_counts[n[i-1]]
+        λ1[i] = rng.gamma(lower_counts + α, 1.0/(n[i-1] + β))
+        λ2[i] = rng.gamma(total_counts - lower_counts + α, 1.0/(ncount - n[i-1] + β))
         n[i] = change_point_inverse_cdf_sample(counts, λ1[i], λ2[i])
     return n, λ1, λ2
 
@@ -122,6 +126,14 @@ ncounts = 101
 α = 2
 β = 1
 
+# %%
+# Validate closed form densities against scipy.stats
+
+λ = numpy.linspace(0.001, 10.0, 200)
+k = numpy.arange(20)
+print(numpy.max(numpy.abs(stats.gamma_log_density(λ, α, 1.0/β) - scipy.stats.gamma.logpdf(λ, α, scale=1.0/β))))
+print(numpy.max(numpy.abs(stats.poisson_log_pmf(k, 2.5) - scipy.stats.poisson.logpmf(k, 2.5))))
+
 # %%
 ## gamma distribution
 
@@ -246,7 +258,7 @@ x = numpy.linspace(xlim[0], xlim[1], nx)
 bins = numpy.linspace(xlim[0], xlim[1], nbins)
 title = r"$λ_1$ Distribution, $λ_1=$"+f"{format(λ1, '2.0f')}"+r", $λ_2=$"+f"{format(λ2, '2.0f')}, n={n}"
 
-samples = [lower_λ_sample(counts, n, α, β) for _ in range(nsample)]
+samples = lower_λ_sample(counts, n, α, β, nsample)
 
 figure, axis = pyplot.subplots(figsize=(10, 7))
 axis.set_xlabel(r"$λ_1$")
@@ -275,7 +287,7 @@ xlim = [μ - 5.0*σ, μ + 5.0*σ]
 x = numpy.linspace(xlim[0], xlim[1], nx)
 bins = numpy.linspace(xlim[0], xlim[1], nbins)
 
-samples = [upper_λ_sample(counts, n, α, β) for _ in range(nsample)]
+samples = upper_λ_sample(counts, n, α, β, nsample)
 title = r"$λ_2$ Distribution, $λ_2=$"+f"{format(λ1, '2.0f')}"+r", $λ_2=$"+f"{format(λ2, '2.0f')}, n={n}"
 
 figure, axis = pyplot.subplots(figsize=(10, 7))
@@ -315,8 +327,8 @@ config.save_post_asset(figure, "gibbs_sampling", "change_point_counts_1")
 
 x = numpy.arange(7)
 figure, axis = pyplot.subplots(figsize=(10, 7))
-axis.bar(x - 0.2, scipy.stats.poisson.pmf(x, λ1), 0.4, label=f"λ = {format(λ1, '2.2f')}", zorder=5)
-axis.bar(x + 0.2, scipy.stats.poisson.pmf(x, λ2), 0.4, label=f"λ = {format(λ2, '2.2f')}", zorder=5)
+axis.bar(x - 0.2, numpy.exp(stats.poisson_log_pmf(x, λ1)), 0.4, label=f"λ = {format(λ1, '2.2f')}", zorder=5)
+axis.bar(x + 0.2, numpy.exp(stats.poisson_log_pmf(x, λ2)), 0.4, label=f"λ = {format(λ2, '2.2f')}", zorder=5)
 axis.set_xlabel("Count")
 axis.set_xticks(x)
 axis.set_ylabel("Probability")
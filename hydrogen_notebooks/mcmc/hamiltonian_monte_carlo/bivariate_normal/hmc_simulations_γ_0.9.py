@@ -133,3 +133,17 @@ hmc.autocor(title, q[:,0], max_lag, f"{file_prefix}-position-autocorrelation-1")
 title = f"HMC Bivariate Normal " + r"$q_2$" + f": γ={γ}, nsample={nsample}, accepted={int(100.0*float(accepted)/float(nsample))}%, " + r"$t_{max}$=" + f"{format(tmax, '2.2f')}"
 max_lag = 25
 hmc.autocor(title, q[:,1], max_lag, f"{file_prefix}-position-autocorrelation-2")
+
+# %%
+# 16 chains integrated together with HMC_chains
+
+nchain = 16
+U_vector = hmc.bivariate_normal_U_vector(γ, σ1, σ2)
+K_vector = hmc.bivariate_normal_K_vector(m1, m2)
+dUdq_vector = hmc.bivariate_normal_dUdq_vector(γ, σ1, σ2)
+dKdp_vector = hmc.bivariate_normal_dKdp_vector(m1, m2)
+momentum_vector_generator = hmc.bivariate_normal_momentum_vector_generator(m1, m2)
+q0_chains = numpy.tile(q0, (nchain, 1))
+
+H_chains, p_chains, q_chains, accepted_chains = hmc.HMC_chains(q0_chains, U_vector, K_vector, dUdq_vector, dKdp_vector, hmc.momentum_verlet_chains_integrator, momentum_vector_generator, nsample, tmax, ε)
+q_chains.reshape(-1, 2).mean(axis=0), q_chains.reshape(-1, 2).std(axis=0), numpy.corrcoef(q_chains.reshape(-1, 2).T)[0, 1]
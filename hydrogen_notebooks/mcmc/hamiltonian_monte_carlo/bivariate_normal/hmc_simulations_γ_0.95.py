@@ -6,6 +6,7 @@ from matplotlib import pyplot
 from glyfish import config
 from glyfish import gplot
 from glyfish import hamiltonian_monte_carlo as hmc
+from glyfish import stats
 from glyfish import bivariate_normal_distribution as bv
 
 %matplotlib inline
@@ -133,3 +134,80 @@ hmc.autocor(title, q[:,0], max_lag, f"{file_prefix}-position-autocorrelation-1")
 title = f"HMC Bivariate Normal " + r"$q_2$" + f": γ={γ}, nsample={nsample}, accepted={int(100.0*float(accepted)/float(nsample))}%, " + r"$t_{max}$=" + f"{format(tmax, '2.2f')}"
 max_lag = 25
 hmc.autocor(title, q[:,1], max_lag, f"{file_prefix}-position-autocorrelation-2")
+
+# %%
+# NUTS with the same potential and kinetic energy. The trajectory length is chosen by the U-turn
+# criterion so tmax is not needed. Cost per effective sample is compared with HMC using the mean
+# number of gradient evaluations per draw, tmax/(2ε) for HMC.
+
+U_vector = hmc.bivariate_normal_U_vector(γ, σ1, σ2)
+K_vector = hmc.bivariate_normal_K_vector(m1, m2)
+dUdq_vector = hmc.bivariate_normal_dUdq_vector(γ, σ1, σ2)
+dKdp_vector = hmc.bivariate_normal_dKdp_vector(m1, m2)
+momentum_vector_generator = hmc.bivariate_normal_momentum_vector_generator(m1, m2)
+ε_nuts = 0.1
+
+H_nuts, p_nuts, q_nuts, tree_depth, ngradient, divergent = hmc.NUTS(q0, U_vector, K_vector, dUdq_vector, dKdp_vector, momentum_vector_generator, nsample, ε_nuts)
+
+ess_hmc = min(stats.effective_sample_size(q[:,0]), stats.effective_sample_size(q[:,1]))
+ess_nuts = min(stats.effective_sample_size(q_nuts[:,0]), stats.effective_sample_size(q_nuts[:,1]))
+print(f"tree depth={numpy.bincount(tree_depth)}, gradients per draw={numpy.mean(ngradient)}, divergences={numpy.sum(divergent)}")
+print(f"HMC ESS per gradient={ess_hmc/(nsample*tmax/(2.0*ε))}, NUTS ESS per gradient={ess_nuts/numpy.sum(ngradient)}")
+
+# %%
+# HMC with ε adapted by dual averaging during 1000 warmup iterations
+
+nwarmup = 1000
+H_adapted, p_adapted, q_adapted, accepted_adapted, ε_adapted = hmc.adaptive_HMC(q0, U_vector, K_vector, dUdq_vector, dKdp_vector, hmc.momentum_verlet_energy_integrator, momentum_vector_generator, nwarmup, nsample, tmax, ε)
+
+ess_adapted = min(stats.effective_sample_size(q_adapted[:,0]), stats.effective_sample_size(q_adapted[:,1]))
+print(f"adapted ε={ε_adapted}, accepted={int(100.0*float(accepted_adapted)/float(nsample))}%, ESS per gradient={ess_adapted/(nsample*tmax/(2.0*ε_adapted))}")
+
+# %%
+# HMC with ε and a diagonal or dense inverse mass matrix adapted during warmup. ESS per gradient is
+# compared with the unit mass run above.
+
+for dense in [False, True]:
+    H_mass, p_mass, q_mass, accepted_mass, ε_mass, Minv = hmc.adaptive_mass_HMC(q0, U_vector, dUdq_vector, hmc.momentum_verlet_energy_integrator, nwarmup, nsample, tmax, ε, dense)
+    ess_mass = min(stats.effective_sample_size(q_mass[:,0]), stats.effective_sample_size(q_mass[:,1]))
+    print(f"dense={dense}, adapted ε={ε_mass}, Minv={Minv}, accepted={int(100.0*float(accepted_mass)/float(nsample))}%, ESS per gradient={ess_mass/(nsample*tmax/(2.0*ε_mass))}")
+
+# %%
+# registered integrators compared by ESS per gradient with ε adapted for each
+
+for name, integrator in hmc.integrators.items():
+    H_int, p_int, q_int, accepted_int, ε_int = hmc.adaptive_HMC(q0, U_vector, K_vector, dUdq_vector, dKdp_vector, integrator, momentum_vector_generator, nwarmup, nsample, tmax, ε)
+    ess_int = min(stats.effective_sample_size(q_int[:,0]), stats.effective_sample_size(q_int[:,1]))
+    print(f"{name}: adapted ε={ε_int}, accepted={int(100.0*float(accepted_int)/float(nsample))}%, ESS per gradient={ess_int/(nsample*integrator.ngradient*tmax/(2.0*ε_int))}")
+
+# %%
+# HMC with the exact Hamiltonian flow as a baseline and the error of the registered integrators
+# relative to it over a trajectory of time tmax
+
+P = numpy.linalg.inv([[σ1**2, γ*σ1*σ2], [γ*σ1*σ2, σ2**2]])
+exact_integrator = hmc.gaussian_exact_integrator(P, 0.0, [1.0/m1, 1.0/m2])
+H_exact, p_exact, q_exact, accepted_exact = hmc.HMC_vector(q0, U_vector, K_vector, dUdq_vector, dKdp_vector, exact_integrator, momentum_vector_generator, nsample, tmax, ε)
+ess_exact = min(stats.effective_sample_size(q_exact[:,0]), stats.effective_sample_size(q_exact[:,1]))
+print(f"exact flow: accepted={int(100.0*float(accepted_exact)/float(nsample))}%, ESS={ess_exact}")
+
+p_test = numpy.array([0.5, 0.3])
+q_test = numpy.array(q0)
+nsteps = int(tmax/ε)
+_, q_reference, _, _ = exact_integrator(p_test, q_test, None, U_vector, dUdq_vector, dKdp_vector, nsteps, ε)
+for name, integrator in hmc.integrators.items():
+    _, q_integrated, _, _ = integrator(p_test, q_test, dUdq_vector(q_test), U_vector, dUdq_vector, dKdp_vector, nsteps, ε)
+    print(f"{name}: position error={numpy.linalg.norm(q_integrated - q_reference)}")
+
+# %%
+# HMC on a potential compiled from a sympy expression with the gradient found symbolically
+
+import sympy
+from glyfish.symbolic_target import CompiledTarget
+
+q1, q2 = sympy.symbols("q1 q2")
+U_symbolic = ((q1*σ2)**2 + (q2*σ1)**2 - 2*q1*q2*σ1*σ2*γ) / (2*σ1**2*σ2**2*(1 - γ**2))
+target = CompiledTarget(U_symbolic, [q1, q2])
+print(target.source)
+
+H_compiled, p_compiled, q_compiled, accepted_compiled = hmc.HMC_vector(q0, target.U, K_vector, target.dUdq, dKdp_vector, hmc.momentum_verlet_energy_integrator, momentum_vector_generator, nsample, tmax, ε)
+print(f"accepted={int(100.0*float(accepted_compiled)/float(nsample))}%, correlation={numpy.corrcoef(q_compiled[:,0], q_compiled[:,1])[0, 1]}")
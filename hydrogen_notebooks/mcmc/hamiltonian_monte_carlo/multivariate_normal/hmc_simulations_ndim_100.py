@@ -0,0 +1,54 @@
+%load_ext autoreload
+%autoreload 2
+
+import numpy
+from matplotlib import pyplot
+from glyfish import config
+from glyfish import hamiltonian_monte_carlo as hmc
+from glyfish import stats
+from glyfish.multivariate_normal_distribution import MultivariateNormal
+
+%matplotlib inline
+
+pyplot.style.use(config.glyfish_style)
+
+# %%
+# 100 dimensional normal target with a random covariance
+
+ndim = 100
+A = numpy.random.normal(size=(ndim, ndim))
+cov = A @ A.T / ndim + 0.1*numpy.eye(ndim)
+μ = numpy.zeros(ndim)
+target = MultivariateNormal(μ, cov)
+
+q0 = target.samples(1)[0]
+nwarmup = 1000
+nsample = 2000
+tmax = 3.0
+ε = 0.05
+
+# %%
+# HMC with a dense mass matrix adapted during warmup
+
+H, p, q, accepted, ε_adapted, Minv = hmc.adaptive_mass_HMC(q0, target.U, target.dUdq, hmc.momentum_verlet_energy_integrator, nwarmup, nsample, tmax, ε, True)
+ess = numpy.min([stats.effective_sample_size(q[:,i]) for i in range(ndim)])
+print(f"adapted ε={ε_adapted}, accepted={int(100.0*float(accepted)/float(nsample))}%, minimum ESS={ess}")
+print(f"maximum mean error={numpy.max(numpy.abs(numpy.mean(q, axis=0) - μ))}, maximum covariance error={numpy.max(numpy.abs(numpy.cov(q.T) - cov))}")
+
+# %%
+# Exact samples for comparison
+
+samples = target.samples(nsample)
+print(f"maximum mean error={numpy.max(numpy.abs(numpy.mean(samples, axis=0) - μ))}, maximum covariance error={numpy.max(numpy.abs(numpy.cov(samples.T) - cov))}")
+
+# %%
+# Gibbs sampling with the conditional distributions of the target
+
+x = q0.copy()
+gibbs_samples = numpy.zeros((nsample, ndim))
+for i in range(nsample):
+    for j in range(ndim):
+        x[j] = target.conditional_sample(x, j)
+    gibbs_samples[i] = x
+ess_gibbs = numpy.min([stats.effective_sample_size(gibbs_samples[:,i]) for i in range(ndim)])
+print(f"Gibbs minimum ESS={ess_gibbs}")
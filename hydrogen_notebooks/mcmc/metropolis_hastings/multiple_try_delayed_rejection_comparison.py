@@ -0,0 +1,76 @@
+# %%
+%load_ext autoreload
+%autoreload 2
+
+import time
+import numpy
+from matplotlib import pyplot
+from glyfish import metropolis_hastings as mh
+from glyfish import config
+from glyfish import stats
+from glyfish.random_blocks import RandomBlocks
+
+%matplotlib inline
+
+pyplot.style.use(config.glyfish_style)
+
+# %%
+
+def ess_per_second(sampler):
+    start = time.time()
+    samples, accepted = sampler()
+    elapsed = time.time() - start
+    return stats.effective_sample_size(samples)/elapsed, accepted
+
+def run_comparison(log_p, stepsize, ntry, scale, nsample, x0, seed):
+    plain = numpy.zeros(len(stepsize))
+    mtm = numpy.zeros(len(stepsize))
+    dr = numpy.zeros(len(stepsize))
+    for i in range(len(stepsize)):
+        blocks = RandomBlocks(seed)
+        generator = mh.normal_block_generator(blocks)
+        plain[i], _ = ess_per_second(lambda: mh.metropolis_hastings_log(log_p, mh.normal_log_proposal, generator, stepsize[i], nsample, x0, blocks))
+        mtm[i], _ = ess_per_second(lambda: mh.multiple_try_metropolis(log_p, stepsize[i], ntry, nsample, x0, blocks))
+        dr[i], _ = ess_per_second(lambda: mh.delayed_rejection_metropolis_hastings(log_p, stepsize[i], nsample, x0, scale, blocks))
+    return plain, mtm, dr
+
+def ess_plot(title, stepsize, plain, mtm, dr):
+    figure, axis = pyplot.subplots(figsize=(10, 7))
+    axis.set_xlabel("Step Size")
+    axis.set_ylabel("Effective Samples per Second")
+    axis.set_title(title)
+    axis.set_prop_cycle(config.alternate_cycler)
+    axis.loglog(stepsize, plain, marker='o', markersize=10.0, label="Metropolis Hastings")
+    axis.loglog(stepsize, mtm, marker='o', markersize=10.0, label="Multiple Try")
+    axis.loglog(stepsize, dr, marker='o', markersize=10.0, label="Delayed Rejection")
+    axis.legend()
+
+# %%
+# weibull target
+
+k = 5.0
+λ = 1.0
+nsample = 50000
+x0 = 1.0
+ntry = 8
+scale = 0.1
+stepsize = 10**numpy.linspace(-1.0, 1.0, 5)
+weibull_plain, weibull_mtm, weibull_dr = run_comparison(stats.weibull_log_pdf(k, λ), stepsize, ntry, scale, nsample, x0, 1)
+
+# %%
+
+title = f"Weibull Distribution, k={k}, λ={λ}"
+ess_plot(title, stepsize, weibull_plain, weibull_mtm, weibull_dr)
+
+# %%
+# arcsine target
+
+nsample = 50000
+x0 = 0.5
+stepsize = 10**numpy.linspace(-1.0, 1.0, 5)
+arcsine_plain, arcsine_mtm, arcsine_dr = run_comparison(stats.arcsine_log_pdf, stepsize, ntry, scale, nsample, x0, 1)
+
+# %%
+
+title = f"Arcsine Distribution"
+ess_plot(title, stepsize, arcsine_plain, arcsine_mtm, arcsine_dr)
@@ -153,3 +153,17 @@ for i in range(len(shape)):
 normalized_step_size = numpy.sqrt(shape*stepsize**2)/σ
 title = f"Weibull Distribution, Gamma Proposal, Normalized Stepsize, k={k}, λ={λ}"
 acceptance_plot(title, normalized_step_size, gamma_acceptance, 20, [50.0, 10.0])
+
+# %%
+# weibull target, adaptive stepsize normal proposal
+
+k = 5.0
+λ = 1.0
+nsample = 100000
+nwarmup = 10000
+x0 = 1.0
+log_target_pdf = stats.weibull_log_pdf(k, λ)
+adaptive_samples, adaptive_accepted, adaptive_stepsize = mh.adaptive_metropolis_hastings(log_target_pdf, 1.0, nwarmup, nsample, x0)
+adaptive_acceptance = 100.0*adaptive_accepted/nsample
+σ = stats.weibull_sigma(k, λ)
+print(f"stepsize={format(adaptive_stepsize, '2.3f')}, normalized stepsize={format(adaptive_stepsize/σ, '2.3f')}, acceptance={format(adaptive_acceptance, '2.0f')}%, ess={format(stats.effective_sample_size(adaptive_samples), '2.0f')}")